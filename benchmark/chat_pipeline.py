@@ -0,0 +1,101 @@
+"""Measure the setup of GLaDOS.chat before the run starts, with stubbed latencies.
+
+    python benchmark/chat_pipeline.py --turns 10 --choose 0.4 --api 0.15 --db 0.02
+
+prints the time of each step, the setup time, and the time saved by running
+steps concurrently compared to running them one after another.
+"""
+
+import os
+import sys
+import time
+import asyncio
+from argparse import ArgumentParser
+from statistics import median
+from types import SimpleNamespace
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+import glados.assistant  # noqa: E402
+from glados.assistant import GLaDOS  # noqa: E402
+from glados.session import Session, SessionManager  # noqa: E402
+
+
+class StubRun:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def until_done(self):
+        pass
+
+
+class StubThreads:
+    """beta threads api answering after a delay"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.messages = self
+        self.runs = self
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(id=f"thread_{time.time()}")
+
+    def create_and_stream(self, **kwargs):
+        return StubRun()
+
+
+async def main(turns: int, choose: float, api: float, db: float):
+    sessions: dict[str, Session] = {}
+
+    async def get_session(session_id):
+        await asyncio.sleep(db)
+        return sessions.setdefault(session_id, Session(session_id, model="gpt-4o"))
+
+    async def save_session(session_id):
+        pass
+
+    async def choose_tools(message):
+        await asyncio.sleep(choose)
+        return None
+
+    SessionManager.get_session = get_session
+    SessionManager.save_session = save_session
+    glados.assistant.choose_tools = choose_tools
+    assistant = GLaDOS()
+    assistant.client = SimpleNamespace(beta=SimpleNamespace(threads=StubThreads(api)))
+
+    results = []
+    for turn in range(turns):
+        # a new thread on the first turn of each session
+        session_id = str(turn // 2)
+        timings = await assistant.chat("hello", handler=None, session_id=session_id)
+        results.append(timings)
+        steps = "  ".join(
+            f"{step} {seconds * 1000:6.1f}ms" for step, seconds in timings.items()
+        )
+        print(f"turn {turn:>3}: {steps}")
+    total = median(r["total"] for r in results) * 1000
+    saved = median(r["saved"] for r in results) * 1000
+    print(f"median setup {total:.1f}ms, saved {saved:.1f}ms per turn")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument(
+        "--choose", type=float, default=0.4, help="seconds to choose tools"
+    )
+    parser.add_argument(
+        "--api", type=float, default=0.15, help="seconds of a threads api call"
+    )
+    parser.add_argument(
+        "--db", type=float, default=0.02, help="seconds to load a session"
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.turns, args.choose, args.api, args.db))
@@ -0,0 +1,63 @@
+"""Measure cold start of the tool registry, with and without the plugin manifest.
+
+    python benchmark/cold_start.py --runs 10
+
+each run is a new interpreter. "import" is the time to import glados.tool,
+"first event" adds what handling a first message needs from the registry:
+formatting all tools and resolving the function of one plugin.
+"""
+
+import os
+import sys
+import json
+import subprocess
+from argparse import ArgumentParser
+from statistics import median
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+SCRIPT = """
+import json, time
+started = time.perf_counter()
+from glados.tool import __registry__, format_tools
+imported = time.perf_counter()
+format_tools(list(__registry__))
+__registry__[{tool!r}]["function"]
+handled = time.perf_counter()
+print(json.dumps([imported - started, handled - started]))
+"""
+
+
+def measure(use_manifest: bool, tool: str) -> tuple[float, float]:
+    env = {
+        **os.environ,
+        "GLADOS_TOOL_MANIFEST": "1" if use_manifest else "0",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "x"),
+    }
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(tool=tool)],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    imported, handled = json.loads(output.splitlines()[-1])
+    return imported, handled
+
+
+def run(runs: int, tool: str):
+    for label, use_manifest in (("eager", False), ("manifest", True)):
+        measure(use_manifest, tool)  # warm up the file system cache and the manifest
+        results = [measure(use_manifest, tool) for _ in range(runs)]
+        imported = median(r[0] for r in results) * 1000
+        handled = median(r[1] for r in results) * 1000
+        print(f"{label:>8}: import {imported:7.1f}ms  first event {handled:7.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--tool", default="get_date", help="plugin used first")
+    args = parser.parse_args()
+    run(args.runs, args.tool)
@@ -0,0 +1,40 @@
+"""Measure latency of Session.append as the session grows.
+
+    python benchmark/session_append.py --messages 5000
+"""
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from glados.session import Session, MAX_TOKENS  # noqa: E402
+
+
+def run(num_messages: int, step: int, model: str):
+    # lift the token limit so the session really grows to num_messages
+    MAX_TOKENS[model] = 10**9
+    session = Session(model=model)
+    elapsed = 0.0
+    for i in range(1, num_messages + 1):
+        content = f"message #{i}: the quick brown fox jumps over the lazy dog"
+        started = time.perf_counter()
+        session(content, role="user" if i % 2 else "assistant")
+        elapsed += time.perf_counter() - started
+        if i % step == 0:
+            print(
+                f"{i:>6} messages  {session.total_tokens:>8} tokens  "
+                f"{elapsed / step * 1e6:8.1f} us/append"
+            )
+            elapsed = 0.0
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--step", type=int, default=500)
+    parser.add_argument("--model", default="gpt-4-turbo")
+    args = parser.parse_args()
+    run(args.messages, args.step, args.model)
@@ -0,0 +1,137 @@
+"""Measure latency to the first streamed chunk of GLaDOSv1.chat against a local stub server.
+
+    python benchmark/stream_latency.py --runs 20 --tool-rounds 1
+
+the stub streams chat completions like the api does, waiting --first-delay
+before the first chunk and --chunk-delay between chunks. a tool round calls
+get_date before the answer.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+from argparse import ArgumentParser
+from statistics import median
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+import glados.assistant  # noqa: E402
+from openai import AsyncOpenAI  # noqa: E402
+from glados.assistant import GLaDOSv1  # noqa: E402
+from glados.tool import format_tools  # noqa: E402
+
+
+def chunk(delta: dict, finish_reason=None) -> bytes:
+    data = {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "stub",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(data)}\n\n".encode()
+
+
+class StubServer:
+    """an http server streaming chat completions"""
+
+    def __init__(self, tool_rounds: int, chunks: int, first_delay: float, chunk_delay: float):
+        self.tool_rounds = tool_rounds
+        self.chunks = chunks
+        self.first_delay = first_delay
+        self.chunk_delay = chunk_delay
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:  # the client closed the connection
+                writer.close()
+                return
+            headers = dict(
+                line.split(": ", 1) for line in head.decode().split("\r\n")[1:] if line
+            )
+            length = int(headers.get("content-length", headers.get("Content-Length", 0)))
+            body = json.loads(await reader.readexactly(length))
+            rounds = sum(1 for m in body["messages"] if m["role"] == "tool")
+            writer.write(
+                b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\n"
+                b"transfer-encoding: chunked\r\n\r\n"
+            )
+            await asyncio.sleep(self.first_delay)
+            if rounds < self.tool_rounds and body.get("tool_choice") != "none":
+                events = [
+                    chunk(
+                        {
+                            "tool_calls": [
+                                {
+                                    "index": 0,
+                                    "id": f"call_{rounds}",
+                                    "type": "function",
+                                    "function": {"name": "get_date", "arguments": "{}"},
+                                }
+                            ]
+                        },
+                        "tool_calls",
+                    )
+                ]
+            else:
+                events = [chunk({"content": f"word{i} "}) for i in range(self.chunks)]
+                events.append(chunk({}, "stop"))
+            events.append(b"data: [DONE]\n\n")
+            for i, event in enumerate(events):
+                if i:
+                    await asyncio.sleep(self.chunk_delay)
+                writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+
+
+async def choose_tools(message):
+    return format_tools(["get_date"])
+
+
+async def measure(glados: GLaDOSv1) -> tuple[float, float]:
+    started = time.perf_counter()
+    first = None
+    async for answer in glados.chat("what date is it today?"):
+        if first is None and isinstance(answer, str):
+            first = time.perf_counter() - started
+    return first, time.perf_counter() - started
+
+
+async def main(args):
+    stub = StubServer(args.tool_rounds, args.chunks, args.first_delay, args.chunk_delay)
+    server = await asyncio.start_server(stub.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    glados.assistant.choose_tools = choose_tools  # don't ask a model for tools
+    assistant = GLaDOSv1()
+    assistant.client = AsyncOpenAI(base_url=f"http://127.0.0.1:{port}/v1", api_key="stub")
+    await measure(assistant)  # warm up the connection
+    results = [await measure(assistant) for _ in range(args.runs)]
+    first = median(r[0] for r in results) * 1000
+    total = median(r[1] for r in results) * 1000
+    overhead = first - args.first_delay * 1000 * (args.tool_rounds + 1)
+    print(
+        f"tool rounds {args.tool_rounds}: first chunk {first:.1f}ms "
+        f"(overhead {overhead:.1f}ms)  total {total:.1f}ms"
+    )
+    await assistant.client.close()
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--tool-rounds", type=int, default=1)
+    parser.add_argument("--chunks", type=int, default=50)
+    parser.add_argument("--first-delay", type=float, default=0.05)
+    parser.add_argument("--chunk-delay", type=float, default=0.002)
+    args = parser.parse_args()
+    asyncio.run(main(args))
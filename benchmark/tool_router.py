@@ -0,0 +1,101 @@
+"""Measure quality and latency of choosing tools, by embedding or by a chat model.
+
+    python benchmark/tool_router.py --mode embedding --mode llm
+
+needs OPENAI_API_KEY. prompts are labelled with the tools they need.
+"""
+
+import os
+import sys
+import time
+import asyncio
+from argparse import ArgumentParser
+from statistics import quantiles
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv()
+
+from glados.tool import __registry__, ask_tool_names  # noqa: E402
+from glados.tool._router import ToolRouter  # noqa: E402
+
+PROMPTS: list[tuple[str, set[str]]] = [
+    ("what time is it now?", {"get_date"}),
+    ("what day of the week is today", {"get_date"}),
+    ("오늘 날짜가 어떻게 돼?", {"get_date"}),
+    ("how many days until christmas?", {"get_date"}),
+    ("draw a cat wearing a space suit", {"draw_image"}),
+    ("can you make a picture of a sunset over the sea", {"draw_image"}),
+    ("고양이 그림 그려줘", {"draw_image"}),
+    ("generate a logo for my coffee shop", {"draw_image"}),
+    ("summarize https://example.com/blog/post-1", {"summarize_url"}),
+    ("tl;dr of this article: https://news.ycombinator.com/item?id=1", {"summarize_url"}),
+    ("이 링크 요약해줘 https://example.com/a", {"summarize_url"}),
+    ("who am I?", {"whoami"}),
+    ("what is my name", {"whoami"}),
+    ("do you know who I am", {"whoami"}),
+    ("hello!", set()),
+    ("thanks, that was helpful", set()),
+    ("explain the difference between a list and a tuple in python", set()),
+    ("write a haiku about autumn", set()),
+    ("what is 17 times 23", set()),
+    ("translate 'good morning' into french", set()),
+]
+
+
+async def run_embedding(router: ToolRouter, prompt: str):
+    names = await router.route(prompt, __registry__)
+    if names is None:
+        return set(await ask_tool_names(prompt) or []), True
+    return set(names), False
+
+
+async def run_llm(router: ToolRouter, prompt: str):
+    return set(await ask_tool_names(prompt) or []), False
+
+
+async def run(mode: str, router: ToolRouter):
+    run_one = run_embedding if mode == "embedding" else run_llm
+    if mode == "embedding":
+        await router.prepare(__registry__)  # once per process, not per message
+    latencies = []
+    correct = fallbacks = 0
+    true_positive = false_positive = false_negative = 0
+    for prompt, expected in PROMPTS:
+        started = time.perf_counter()
+        chosen, fell_back = await run_one(router, prompt)
+        latencies.append((time.perf_counter() - started) * 1000)
+        correct += chosen == expected
+        fallbacks += fell_back
+        true_positive += len(chosen & expected)
+        false_positive += len(chosen - expected)
+        false_negative += len(expected - chosen)
+        if chosen != expected:
+            print(f"  miss: {prompt!r} expected {sorted(expected)} got {sorted(chosen)}")
+    p50, p95 = (quantiles(latencies, n=100)[i] for i in (49, 94))
+    precision = true_positive / max(1, true_positive + false_positive)
+    recall = true_positive / max(1, true_positive + false_negative)
+    print(
+        f"{mode:>9}: exact {correct}/{len(PROMPTS)}  precision {precision:.2f}  "
+        f"recall {recall:.2f}  fallback {fallbacks}/{len(PROMPTS)}  "
+        f"p50 {p50:.0f}ms  p95 {p95:.0f}ms"
+    )
+
+
+async def main(modes: list[str], select: float, reject: float):
+    router = ToolRouter(select=select, reject=reject)
+    for mode in modes:
+        await run(mode, router)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--mode", action="append", choices=["embedding", "llm"], default=None
+    )
+    parser.add_argument("--select", type=float, default=ToolRouter().select)
+    parser.add_argument("--reject", type=float, default=ToolRouter().reject)
+    args = parser.parse_args()
+    asyncio.run(main(args.mode or ["embedding", "llm"], args.select, args.reject))
@@ -1,22 +1,22 @@
 import os
+import time
 import asyncio
-from typing import Optional, AsyncGenerator
+import logging
+from typing import Awaitable, Optional, AsyncGenerator
 from enum import Enum
-from openai import (
-    OpenAI,
-    AsyncAssistantEventHandler,
-    AsyncOpenAI,
-)
-from openai.types.chat.chat_completion_chunk import ChoiceDeltaToolCall
+from openai import AsyncAssistantEventHandler
 from openai.types.beta.threads.message_create_params import (
     Attachment,
     MessageContentPartParam,
 )
 from .backend.db import use_db
+from .backend.client import use_openai
 from .session import SessionManager, Session
-from .tool import invoke_tool_calls, choose_tools, context
+from .tool import invoke_tool_calls, choose_tools, context, format_tools
 from typing import TypedDict
 
+MAX_TOOL_ROUNDS = int(os.environ.get("GLADOS_MAX_TOOL_ROUNDS", 5))
+
 
 class EventType(str, Enum):
     FUNCTION_CALLING = "function_calling"
@@ -29,10 +29,11 @@ class AssistantResponse(TypedDict):
 
 
 class GLaDOSv1:
-    def __init__(self):
-        self.client = OpenAI()
-        self.client = AsyncOpenAI()
+    def __init__(self, *, max_tool_rounds: int = MAX_TOOL_ROUNDS):
+        self.client = use_openai()
         self.session = None
+        # max rounds of tool calls in a chat, then the model answers without tools
+        self.max_tool_rounds = max_tool_rounds
 
     async def chat(
         self,
@@ -75,72 +76,73 @@ class GLaDOSv1:
             # if tools is not provided, choose tools from the message
             tools = await choose_tools(message)
 
-        async def gen_answer():
-            """Generate the assistant's answer.
-            for the clients like Slack, generates answer line by line.
-            """
-            completion = session.invoke(self.client, stream=True, tools=tools)
-
-            assistant_message = ""
-            tool_calls: list[ChoiceDeltaToolCall] = []
-            for chunk in completion:
+        [read_tool] = format_tools(["read_tool_output"])
+        for round in range(self.max_tool_rounds + 1):
+            options = {"tools": tools} if tools else {}
+            if tools and round == self.max_tool_rounds:
+                # no more tool calls, the model should answer with what it has
+                options["tool_choice"] = "none"
+            stream = await session.invoke_async(self.client, stream=True, **options)
+
+            content: list[str] = []
+            tool_calls: dict[int, dict] = {}  # tool calls by index, being streamed
+            arguments: dict[int, list[str]] = {}  # argument fragments by index
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
                 delta = chunk.choices[0].delta
-
-                # collect partial tool calls message delta and reassemble them
-                if delta.tool_calls:
-                    for partial_tool_call in delta.tool_calls:
-                        if partial_tool_call.id is not None:
-                            # Extend tool_calls list if necessary
-                            while len(tool_calls) <= partial_tool_call.index:
-                                tool_calls.append(None)
-
-                            tool_calls[partial_tool_call.index] = partial_tool_call
-                        if partial_tool_call.function.name is not None:
-                            tool_calls[
-                                partial_tool_call.index
-                            ].function.name = partial_tool_call.function.name
-                        if partial_tool_call.function.arguments is not None:
-                            tool_calls[
-                                partial_tool_call.index
-                            ].function.arguments += partial_tool_call.function.arguments
-
-                # append content to assistant message
                 if delta.content:
-                    assistant_message += delta.content
+                    content.append(delta.content)
                     yield delta.content
+                # tool calls come in fragments, the first one has the id and name
+                for partial in delta.tool_calls or ():
+                    tool_call = tool_calls.get(partial.index)
+                    if tool_call is None:
+                        tool_call = tool_calls[partial.index] = {
+                            "id": partial.id,
+                            "type": "function",
+                            "function": {"name": "", "arguments": ""},
+                        }
+                        arguments[partial.index] = []
+                    if partial.id is not None:
+                        tool_call["id"] = partial.id
+                    if partial.function is not None:
+                        if partial.function.name is not None:
+                            tool_call["function"]["name"] = partial.function.name
+                        if partial.function.arguments is not None:
+                            arguments[partial.index].append(partial.function.arguments)
+
+            if not tool_calls:
+                # at the end of the conversation, save entire assistant message
+                if content:
+                    session("".join(content), role="assistant")
+                break
+
+            calls = [tool_calls[index] for index in sorted(tool_calls)]
+            for index, tool_call in tool_calls.items():
+                tool_call["function"]["arguments"] = "".join(arguments[index])
+            session(
+                {"content": "".join(content) or None, "tool_calls": calls},
+                role="assistant",
+            )
+
+            # show tool calls information to ui
+            yield AssistantResponse(
+                event=EventType.FUNCTION_CALLING,
+                content=",".join(call["function"]["name"] for call in calls),
+            )
+
+            # call tools and append the result to session
+            context.set(session)
+            for tool_message in await invoke_tool_calls(calls):
+                session(tool_message)
+
+            # let the model read the rest of truncated outputs
+            if session.spills and read_tool not in (tools or []):
+                tools = (tools or []) + [read_tool]
 
-                if chunk.choices[0].finish_reason == "tool_calls":
-                    # append tool calls message to session
-                    m = {
-                        "tool_calls": [c.dict() for c in tool_calls if c is not None],
-                    }
-                    session(m, role="assistant")
-
-                    # show tool calls information to ui
-                    tool_names = [f.function.name for f in tool_calls]
-                    yield AssistantResponse(
-                        event=EventType.FUNCTION_CALLING,
-                        content=",".join(tool_names),
-                    )
-
-                    # call tools and append the result to session
-                    context.set(session)
-                    calls = await invoke_tool_calls(tool_calls)
-                    for tool_message in calls:
-                        session(tool_message)
-                    tool_calls = []
-
-                    # finally send the tool calls result to client and stream the result
-                    async for answer in gen_answer():
-                        yield answer
-                    return
-
-            # at the end of the conversation, save entire assistant message to session
-            if assistant_message:
-                session(assistant_message, role="assistant")
-
-        async for answer in gen_answer():
-            yield answer
+        if session_id:
+            await SessionManager.save_session(session_id)
 
     async def natural_delay_generator(self, source: str) -> AsyncGenerator[str, None]:
         """Generate a natural delay between lines."""
@@ -153,7 +155,7 @@ class GLaDOS:
     """An alternative assistant that uses the beta assistant API."""
 
     def __init__(self):
-        self.client = AsyncOpenAI()
+        self.client = use_openai()
         self.assistant_id = os.environ.get("GLADOS_ASSISTANT_ID")
 
     async def chat(
@@ -164,7 +166,7 @@ class GLaDOS:
         session_id: str,
         attachments: Optional[list[Attachment]] = None,
         tools: Optional[list[str]] = [],
-    ) -> None:
+    ) -> dict[str, float]:
         """Try to chat with the assistant.
 
         Args:
@@ -174,34 +176,64 @@ class GLaDOS:
             attachments (list[Attachment], optional): The list of attachments to include in the conversation. Defaults to None.
             image_urls (list[str], optional): The list of image URLs to include in the conversation. Defaults to None.
             tools (list[str], optional): The list of tools to use. Defaults to [].
-        """
-        need_to_save = False
-        session = await SessionManager.get_session(session_id)
-        SessionManager.current = session
-
-        tools = [{"type": "code_interpreter"}, {"type": "file_search"}]
-        functions = await choose_tools(message)
-        if functions:
-            tools.extend(functions)
-
-        if (
-            not session.thread_id
-        ):  # if session.thread_id is not set, create a new thread
-            thread = await self.client.beta.threads.create()
-            session.thread_id = thread.id
-            need_to_save = True
-
-        session(message)
 
-        if need_to_save:
+        Returns:
+            dict[str, float]: The seconds of each setup step before the run started.
+        """
+        started = time.perf_counter()
+        timings: dict[str, float] = {}
+
+        async def timed(step: str, awaitable: Awaitable):
+            step_started = time.perf_counter()
+            try:
+                return await awaitable
+            finally:
+                timings[step] = time.perf_counter() - step_started
+
+        async def select_tools() -> list[dict]:
+            functions = await choose_tools(message)
+            builtins = [{"type": "code_interpreter"}, {"type": "file_search"}]
+            return builtins + (functions or [])
+
+        async def post_message(session: Session):
+            if not session.thread_id:
+                # if session.thread_id is not set, create a new thread
+                thread = await self.client.beta.threads.create()
+                session.thread_id = thread.id
+            # written in background, after the thread is known
             await SessionManager.save_session(session_id)
-
-        await self.client.beta.threads.messages.create(
-            thread_id=session.thread_id,
-            role="user",
-            content=message,
-            attachments=attachments,
-        )
+            await self.client.beta.threads.messages.create(
+                thread_id=session.thread_id,
+                role="user",
+                content=message,
+                attachments=attachments,
+            )
+
+        # choosing tools depends on the message only, so it runs along the others
+        tools_task = asyncio.ensure_future(timed("choose_tools", select_tools()))
+        try:
+            session = await timed("get_session", SessionManager.get_session(session_id))
+            SessionManager.current = session
+            session(message)
+            await timed("post_message", post_message(session))
+            tools = await tools_task
+        finally:
+            tools_task.cancel()
+        # outputs of function tools may be truncated in the run, to be read by pages.
+        # tools of a run can't be changed when submitting tool outputs
+        [read_tool] = format_tools(["read_tool_output"])
+        functions = [tool for tool in tools if tool["type"] == "function"]
+        if (session.spills or functions) and read_tool not in tools:
+            tools = tools + [read_tool]
+
+        total = time.perf_counter() - started
+        setup_timings = {
+            **timings,
+            "total": total,
+            # time a sequential setup would take more
+            "saved": max(0.0, sum(timings.values()) - total),
+        }
+        logging.debug(f"Setup of chat {session_id}: {setup_timings}")
 
         async with self.client.beta.threads.runs.create_and_stream(
             thread_id=session.thread_id,
@@ -210,3 +242,4 @@ class GLaDOS:
             event_handler=handler,
         ) as stream:
             await stream.until_done()
+        return setup_timings
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class Actor:
+    """A mailbox of jobs and a worker running them one by one in order.
+
+    the worker stops after idle_timeout seconds without jobs.
+    """
+
+    def __init__(
+        self,
+        key: Hashable,
+        *,
+        idle_timeout: float,
+        on_exit: Callable[["Actor"], None],
+    ):
+        self.key = key
+        self.idle_timeout = idle_timeout
+        self.on_exit = on_exit
+        self.mailbox: asyncio.Queue[tuple[Job, asyncio.Future]] = asyncio.Queue()
+        self.running = False
+        self.closed = False
+        self.stopping = False
+        self.futures: set[asyncio.Future] = set()  # of jobs sent and not done
+        self.worker = asyncio.create_task(self._run())
+        # also when cancelled before it starts running
+        self.worker.add_done_callback(self._on_done)
+
+    @property
+    def depth(self) -> int:
+        """number of jobs waiting or running"""
+        return self.mailbox.qsize() + int(self.running)
+
+    def send(self, job: Job) -> asyncio.Future:
+        """Put a job into the mailbox. returns a future of the result."""
+        future = asyncio.get_running_loop().create_future()
+        self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+        self.mailbox.put_nowait((job, future))
+        return future
+
+    def stop(self):
+        """Cancel the worker. waiting jobs are cancelled."""
+        self.stopping = True
+        self.worker.cancel()
+
+    def _cancelled(self) -> bool:
+        """whether the worker is cancelled, not only the job it runs"""
+        cancelling = getattr(self.worker, "cancelling", None)  # python 3.11+
+        return self.stopping or (cancelling is not None and cancelling() > 0)
+
+    async def _run(self):
+        try:
+            while True:
+                try:
+                    job, future = await asyncio.wait_for(
+                        self.mailbox.get(), timeout=self.idle_timeout
+                    )
+                except asyncio.TimeoutError:
+                    if self.mailbox.empty():
+                        break
+                    continue
+                if self._cancelled():  # wait_for may return a job when cancelled
+                    future.cancel()
+                    raise asyncio.CancelledError()
+                if future.cancelled():  # nobody waits for the result
+                    continue
+                self.running = True
+                try:
+                    result = await job()
+                except asyncio.CancelledError:
+                    future.cancel()
+                    if self._cancelled():
+                        raise
+                except Exception as exc:
+                    if not future.done():
+                        future.set_exception(exc)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+                finally:
+                    self.running = False
+        finally:
+            self.closed = True
+
+    def _on_done(self, worker: asyncio.Task):
+        self.closed = True
+        # nobody runs the jobs left, don't let their senders wait forever
+        for future in list(self.futures):
+            future.cancel()
+        self.on_exit(self)
+
+
+class Actors:
+    """Actors by key. jobs of a key run in order, jobs of different keys
+    run concurrently. idle actors are reaped."""
+
+    def __init__(self, idle_timeout: float = 60.0):
+        self.idle_timeout = idle_timeout
+        self.actors: dict[Hashable, Actor] = {}
+
+    def _on_exit(self, actor: Actor):
+        if self.actors.get(actor.key) is actor:
+            del self.actors[actor.key]
+
+    async def run(self, key: Hashable, job: Job) -> Any:
+        """Run a job after the jobs of the key sent before."""
+        actor = self.actors.get(key)
+        if actor is None or actor.closed:
+            actor = Actor(key, idle_timeout=self.idle_timeout, on_exit=self._on_exit)
+            self.actors[key] = actor
+        return await actor.send(job)
+
+    def depth(self, key: Hashable) -> int:
+        """number of jobs of the key waiting or running"""
+        actor = self.actors.get(key)
+        return actor.depth if actor is not None else 0
+
+    def depths(self) -> dict[Hashable, int]:
+        return {key: actor.depth for key, actor in self.actors.items()}
+
+    async def close(self):
+        """Stop all actors. waiting jobs are cancelled."""
+        actors = list(self.actors.values())
+        for actor in actors:
+            actor.stop()
+        for actor in actors:
+            try:
+                await actor.worker
+            except asyncio.CancelledError:
+                pass
+            except Exception as exc:
+                logging.error(f"Error while stopping actor {actor.key}", exc_info=exc)
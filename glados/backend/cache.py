@@ -0,0 +1,174 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterator, Optional
+
+
+class LRUCache:
+    """A least recently used cache bounded by number of items and total weight.
+
+    items are not evicted on insertion. call `evict()` to pop the items over
+    the capacity, so the owner can decide what to do with them (e.g. flush to
+    database) before they are dropped.
+    """
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = None,
+        *,
+        maxweight: Optional[int] = None,
+        weigh: Callable[[Any], int] = lambda value: 0,
+    ):
+        self.maxsize = maxsize
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._weights: dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._data)
+
+    def __getitem__(self, key: Hashable) -> Any:
+        return self._data[key]
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self._reweigh(key)
+
+    def __delitem__(self, key: Hashable):
+        del self._data[key]
+        self.weight -= self._weights.pop(key)
+
+    def _reweigh(self, key: Hashable):
+        weight = self.weigh(self._data[key])
+        self.weight += weight - self._weights.get(key, 0)
+        self._weights[key] = weight
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get an item and mark it as recently used."""
+        if key not in self._data:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        self._reweigh(key)  # the item may have grown since last access
+        return self._data[key]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Get an item without touching the usage order and counters."""
+        return self._data.get(key, default)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._data:
+            return default
+        value = self._data[key]
+        del self[key]
+        return value
+
+    def clear(self):
+        self._data.clear()
+        self._weights.clear()
+        self.weight = 0
+
+    def values(self):
+        return self._data.values()
+
+    def items(self):
+        return self._data.items()
+
+    def is_full(self) -> bool:
+        """Check if the cache exceeds its capacity."""
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            return True
+        if self.maxweight is not None and self.weight > self.maxweight:
+            return True
+        return False
+
+    def evict(self) -> list[tuple[Hashable, Any]]:
+        """Pop least recently used items until the cache fits in its capacity.
+        The most recently used item is never evicted."""
+        evicted = []
+        while len(self._data) > 1 and self.is_full():
+            key, value = self._data.popitem(last=False)
+            self.weight -= self._weights.pop(key)
+            evicted.append((key, value))
+        self.evictions += len(evicted)
+        return evicted
+
+    def stats(self) -> dict:
+        """Get the usage counters of the cache."""
+        return {
+            "size": len(self._data),
+            "weight": self.weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class TTLCache(LRUCache):
+    """A least recently used cache whose items expire after ttl seconds.
+
+    unlike LRUCache, items over the capacity are dropped on insertion.
+    """
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = None,
+        *,
+        ttl: float,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.timer = timer
+        self._expires: dict[Hashable, float] = {}
+
+    def _expire(self, key: Hashable):
+        if key in self._data and self._expires[key] <= self.timer():
+            del self[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        self._expire(key)
+        return key in self._data
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self.set(key, value)
+
+    def __delitem__(self, key: Hashable):
+        super().__delitem__(key)
+        del self._expires[key]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Set an item expiring after ttl seconds, or the default ttl."""
+        super().__setitem__(key, value)
+        self._expires[key] = self.timer() + (self.ttl if ttl is None else ttl)
+        self.evict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        self._expire(key)
+        return super().get(key, default)
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        self._expire(key)
+        return super().peek(key, default)
+
+    def clear(self):
+        super().clear()
+        self._expires.clear()
+
+    def evict(self) -> list[tuple[Hashable, Any]]:
+        evicted = super().evict()
+        for key, _ in evicted:
+            del self._expires[key]
+        return evicted
@@ -0,0 +1,57 @@
+import os
+from typing import Optional
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # pragma: no cover
+    h2 = None
+
+# connection pool of the client shared by the process
+MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 100))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20))
+KEEPALIVE_EXPIRY = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", 60))
+# multiplex requests over a connection, if h2 is installed
+HTTP2 = os.environ.get("OPENAI_HTTP2", "1") == "1" and h2 is not None
+
+_client: Optional[AsyncOpenAI] = None
+_pid: Optional[int] = None
+
+
+def make_openai() -> AsyncOpenAI:
+    """Make a client with a tuned connection pool."""
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        http2=HTTP2,
+    )
+    return AsyncOpenAI(http_client=http_client)
+
+
+def use_openai() -> AsyncOpenAI:
+    """Get the client shared by the process, so requests reuse connections."""
+    global _client, _pid
+    # connections can't be shared with a forked process
+    if _client is None or _pid != os.getpid():
+        _client = make_openai()
+        _pid = os.getpid()
+    return _client
+
+
+def set_openai(client: Optional[AsyncOpenAI]):
+    """Replace the shared client, e.g. with a stub in tests. None makes a new one on next use."""
+    global _client, _pid
+    _client = client
+    _pid = os.getpid()
+
+
+async def close_openai():
+    """Close connections of the shared client. should be called on shutdown."""
+    global _client
+    client, _client = _client, None
+    if client is not None and _pid == os.getpid():
+        await client.close()
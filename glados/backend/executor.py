@@ -0,0 +1,50 @@
+import os
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+THREAD_WORKERS = int(os.environ.get("GLADOS_THREAD_WORKERS", 16))
+PROCESS_WORKERS = int(os.environ.get("GLADOS_PROCESS_WORKERS", os.cpu_count() or 1))
+
+_executors: dict[str, Executor] = {}
+
+
+def get_executor(kind: str = "thread") -> Executor:
+    """Get the shared pool of a kind, "thread" or "process". created on first use."""
+    if kind not in _executors:
+        if kind == "thread":
+            _executors[kind] = ThreadPoolExecutor(
+                max_workers=THREAD_WORKERS, thread_name_prefix="glados"
+            )
+        elif kind == "process":
+            # don't fork a process running an event loop and threads
+            _executors[kind] = ProcessPoolExecutor(
+                max_workers=PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            raise ValueError(f"unknown executor {kind}")
+    return _executors[kind]
+
+
+async def run_in_executor(fn: Callable, *args, executor: str = "thread") -> Any:
+    """Run a blocking function off the event loop.
+
+    in a thread, it sees the context variables of the caller. in a process, it
+    sees nothing of the caller, so the function and arguments must be picklable.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(fn, *args)
+    if executor == "thread":
+        call = functools.partial(contextvars.copy_context().run, call)
+    return await loop.run_in_executor(get_executor(executor), call)
+
+
+def shutdown(wait: bool = True):
+    """Shut down the pools. they are created again when used after that."""
+    while _executors:
+        _, executor = _executors.popitem()
+        executor.shutdown(wait=wait, cancel_futures=True)
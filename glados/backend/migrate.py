@@ -0,0 +1,60 @@
+"""Rewrite stored session snapshots in another layout.
+
+    python -m glados.backend.migrate --format compact
+
+Run it while bots are stopped, or are already writing the target layout
+(SESSION_SNAPSHOT_FORMAT), so they don't append to rewritten snapshots.
+"""
+
+import asyncio
+from argparse import ArgumentParser
+from pymongo import UpdateOne
+from .db import use_db
+from . import snapshot as snapshots
+
+FORMATS = {"raw": snapshots.RAW_FORMAT, "compact": snapshots.COMPACT_FORMAT}
+
+
+async def migrate_snapshots(format: int, batch_size: int = 500) -> int:
+    """Rewrite session snapshots not in the layout. returns number of rewritten."""
+    col = use_db().get_collection("sessions")
+    if format == snapshots.COMPACT_FORMAT:
+        query = {"format_version": {"$ne": snapshots.COMPACT_FORMAT}}
+    else:
+        query = {"format_version": snapshots.COMPACT_FORMAT}
+
+    operations = []
+    num_migrated = 0
+    async for snapshot in col.find(query):
+        messages = snapshots.read_messages(snapshot)
+        operations.append(
+            UpdateOne(
+                {"_id": snapshot["_id"]},
+                snapshots.messages_update(messages, format),
+            )
+        )
+        if len(operations) >= batch_size:
+            await col.bulk_write(operations, ordered=False)
+            num_migrated += len(operations)
+            operations = []
+    if operations:
+        await col.bulk_write(operations, ordered=False)
+        num_migrated += len(operations)
+    return num_migrated
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = ArgumentParser(description="rewrite session snapshots")
+    parser.add_argument(
+        "--format", required=True, choices=FORMATS.keys(), help="layout to write"
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    num_migrated = asyncio.run(
+        migrate_snapshots(FORMATS[args.format], batch_size=args.batch_size)
+    )
+    print(f"{num_migrated} sessions are rewritten in {args.format} format")
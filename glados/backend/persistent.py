@@ -1,5 +1,142 @@
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Callable, Hashable, Optional
+from pymongo import UpdateOne
 from ..backend.db import use_db
-from ..session import Session
+
+if TYPE_CHECKING:
+    from ..session import Session
+
+
+class WriteBehind:
+    """Buffer changed items and write them to a collection in batches.
+
+    items are marked with `mark()` and written with a single `bulk_write` when
+    the buffer reaches `batch_size` or every `interval` seconds, whichever
+    comes first. the write operation of an item is made at the time of flush,
+    so an item marked many times between flushes is written only once.
+    if the write fails, `rollback` is called with each item before retrying.
+    """
+
+    def __init__(
+        self,
+        collection: str,
+        make_operation: Callable[[Any], UpdateOne],
+        *,
+        rollback: Optional[Callable[[Any], None]] = None,
+        interval: float = 1.0,
+        batch_size: int = 100,
+    ):
+        self.collection = collection
+        self.make_operation = make_operation
+        self.rollback = rollback
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pending: dict[Hashable, Any] = {}
+        self.flushing: dict[Hashable, Any] = {}
+        self.flushes = 0
+        self.writes = 0
+        self._task: Optional[asyncio.Task] = None
+        self._writing: Optional[asyncio.Task] = None  # the write in progress
+        self._full: Optional[asyncio.Event] = None
+
+    def get(self, key: Hashable) -> Any:
+        """Get an item waiting to be written."""
+        if key in self.pending:
+            return self.pending[key]
+        return self.flushing.get(key)
+
+    def mark(self, key: Hashable, item: Any):
+        """Mark an item to be written."""
+        self.pending[key] = item
+        self._ensure_running()
+        if self._full is not None and len(self.pending) >= self.batch_size:
+            self._full.set()
+
+    def _ensure_running(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # no event loop, items are written on next flush
+            return
+        if (
+            self._task is None
+            or self._task.done()
+            or self._task.get_loop() is not loop
+        ):
+            self._full = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as exc:
+                logging.error(f"Error while writing {self.collection}", exc_info=exc)
+
+    async def flush(self):
+        """Write all pending items now, after the write in progress if any.
+        when it returns, every item marked before is written."""
+        loop = asyncio.get_running_loop()
+        while (
+            self._writing is not None
+            and not self._writing.done()
+            and self._writing.get_loop() is loop
+        ):
+            # the items of a failed write are pending again, written below
+            writing = self._writing
+            await asyncio.wait([writing])
+            if not writing.cancelled() and writing.exception() is not None:
+                logging.warning(f"Retrying a failed write of {self.collection}")
+        if not self.pending:
+            return
+        items, self.pending = self.pending, {}
+        self.flushing.update(items)
+        self._writing = loop.create_task(self._write(items))
+        # the write goes on even if the caller is cancelled, like by close()
+        await asyncio.shield(self._writing)
+
+    async def _write(self, items: dict[Hashable, Any]):
+        try:
+            operations = [self.make_operation(item) for item in items.values()]
+            await use_db().get_collection(self.collection).bulk_write(
+                operations, ordered=False
+            )
+            self.flushes += 1
+            self.writes += len(operations)
+        except BaseException:
+            # retry on next flush unless the item is marked again meanwhile
+            for key, item in items.items():
+                if self.rollback is not None:
+                    self.rollback(item)
+                self.pending.setdefault(key, item)
+            raise
+        finally:
+            for key in items:
+                self.flushing.pop(key, None)
+
+    async def close(self):
+        """Stop writing in background and write all pending items."""
+        if self._task is not None:
+            # the write in progress is not cancelled, flush waits for it
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "writes": self.writes,
+        }
 
 
 async def persist(key: str, data: dict):
@@ -12,7 +149,7 @@ async def retrieve(key: str) -> dict:
     return {}
 
 
-async def save_thread(session: Session):
+async def save_thread(session: "Session"):
     """Save thread"""
     ...
 
@@ -0,0 +1,344 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import multiprocessing
+from bisect import bisect
+from typing import Any, Awaitable, Callable, Hashable, Iterable, Optional
+from . import executor
+from .client import close_openai
+from .cache import LRUCache
+
+
+def hash_key(key: str) -> int:
+    """a stable 64 bit hash of a key, same in every process"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of keys to nodes.
+
+    each node is placed at `replicas` points of the ring, and a key belongs to
+    the node of the first point after the hash of the key. adding or removing
+    a node moves only the keys of that node.
+    """
+
+    def __init__(self, nodes: Iterable[Hashable] = (), replicas: int = 100):
+        self.replicas = replicas
+        self.nodes: set[Hashable] = set()
+        self._points: list[int] = []
+        self._owners: list[Hashable] = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def _rebuild(self):
+        ring = sorted(
+            (hash_key(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(self.replicas)
+        )
+        self._points = [point for point, _ in ring]
+        self._owners = [node for _, node in ring]
+
+    def add(self, node: Hashable):
+        self.nodes.add(node)
+        self._rebuild()
+
+    def remove(self, node: Hashable):
+        self.nodes.discard(node)
+        self._rebuild()
+
+    def get(self, key: str) -> Hashable:
+        """Get the node owning the key."""
+        if not self._points:
+            raise LookupError("no nodes in the ring")
+        index = bisect(self._points, hash_key(key)) % len(self._points)
+        return self._owners[index]
+
+
+def routing_key(payload: dict) -> Optional[str]:
+    """the session id of a slack event payload, as the slack bot decides it"""
+    event = payload.get("event") or {}
+    return event.get("thread_ts") or event.get("ts")
+
+
+def run_worker(
+    shard: int,
+    inbox: multiprocessing.Queue,
+    outbox: multiprocessing.Queue,
+    setup: Optional[Callable[[], Awaitable[Any]]] = None,
+):
+    """Entry point of a shard worker process."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    asyncio.run(serve_worker(shard, inbox, outbox, setup))
+
+
+async def serve_worker(
+    shard: int,
+    inbox: multiprocessing.Queue,
+    outbox: multiprocessing.Queue,
+    setup: Optional[Callable[[], Awaitable[Any]]] = None,
+    handle: Optional[Callable[[dict], Awaitable[Any]]] = None,
+):
+    """Handle slack events routed to the shard, with the sessions it owns.
+    events are handled by the slack bot, unless `handle` is given."""
+    from ..session import SessionManager
+
+    if handle is None:
+        from slack_bolt.request.async_request import AsyncBoltRequest
+        from ..client.slack.bot import app
+
+        async def handle(payload: dict):
+            await app.async_dispatch(AsyncBoltRequest(mode="socket_mode", body=payload))
+
+    loop = asyncio.get_running_loop()
+    tasks: set[asyncio.Task] = set()
+    # other workers create sessions too, an id missing in the index may exist
+    SessionManager.trust_index = False
+
+    async def dispatch(payload: dict):
+        try:
+            await handle(payload)
+        except Exception as exc:
+            logging.error(f"Error while handling event in shard {shard}", exc_info=exc)
+
+    async def release(request_id: int, ring: HashRing, session_ids: list[str]):
+        """write sessions moved to other shards and forget them.
+        the sessions are the recently routed ones the router knows moved,
+        and the cached ones the shard does not own in the new ring."""
+        session_ids = set(session_ids) | {
+            session_id
+            for session_id in list(SessionManager.sessions)
+            if ring.get(session_id) != shard
+        }
+
+        async def release_session(session_id):
+            session = SessionManager.sessions.peek(session_id)
+            if session is not None:
+                SessionManager.writer.mark(session_id, session)
+            SessionManager.clear_session(session_id)
+
+        # release after the jobs of the session already sent
+        await asyncio.gather(
+            *[
+                SessionManager.run(session_id, lambda s=session_id: release_session(s))
+                for session_id in session_ids
+            ]
+        )
+        # flush waits for a write in progress too, all is written on reply
+        await SessionManager.flush()
+        outbox.put((request_id, shard))
+
+    def adopt(request_id: int, session_ids: list[str]):
+        """own sessions moved from other shards, which are written already"""
+        for session_id in session_ids:
+            # a copy cached when the shard owned it before may be stale
+            SessionManager.clear_session(session_id)
+            SessionManager.known.add(session_id)
+            SessionManager.missing.pop(session_id)
+        outbox.put((request_id, shard))
+
+    if setup is not None:
+        await setup()
+    stop_id = None
+    try:
+        while True:
+            kind, *args = await loop.run_in_executor(None, inbox.get)
+            if kind == "event":
+                task = asyncio.create_task(dispatch(*args))
+            elif kind == "release":
+                task = asyncio.create_task(release(*args))
+            elif kind == "adopt":
+                adopt(*args)
+                continue
+            else:  # stop
+                stop_id = args[0]
+                break
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await SessionManager.close()
+        executor.shutdown()
+        await close_openai()
+        outbox.put((stop_id, shard))
+
+
+class ShardRouter:
+    """Routes slack events to worker processes by consistent hash of session id.
+
+    each worker owns the sessions hashed to it. on resize, the sessions
+    recently routed to a worker which lose their owner are released, written
+    and dropped by the worker, and adopted by the new owner, before events of
+    them go to the new owner.
+    """
+
+    def __init__(
+        self,
+        num_shards: int,
+        *,
+        setup: Optional[Callable[[], Awaitable[Any]]] = None,
+        track: int = 10000,
+    ):
+        self.num_shards = num_shards
+        self.setup = setup  # run in each worker before handling events
+        self.ring = HashRing()
+        self.workers: dict[int, tuple[multiprocessing.Process, Any]] = {}
+        self.owners = LRUCache(track)  # recently routed session id to shard
+        self._context = multiprocessing.get_context("spawn")
+        self._outbox = self._context.Queue()
+        self._replies: dict[int, asyncio.Future] = {}
+        self._request_ids = itertools.count(1)
+        self._collector: Optional[asyncio.Task] = None
+        self._rebalancing: Optional[asyncio.Future] = None
+        self._resizing = asyncio.Lock()  # one resize at a time
+
+    def _start_worker(self, shard: int):
+        inbox = self._context.Queue()
+        process = self._context.Process(
+            target=run_worker,
+            args=(shard, inbox, self._outbox, self.setup),
+            name=f"glados-shard-{shard}",
+            daemon=True,
+        )
+        process.start()
+        self.workers[shard] = (process, inbox)
+
+    async def start(self):
+        self._collector = asyncio.create_task(self._collect_replies())
+        for shard in range(self.num_shards):
+            self._start_worker(shard)
+            self.ring.add(shard)
+
+    async def _collect_replies(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            reply = await loop.run_in_executor(None, self._outbox.get)
+            if reply is None:
+                break
+            request_id, _ = reply
+            future = self._replies.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_result(reply)
+
+    def _request(self, shard: int, kind: str, *args) -> asyncio.Future:
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._replies[request_id] = future
+        _, inbox = self.workers[shard]
+        inbox.put((kind, request_id, *args))
+        return future
+
+    async def route(self, payload: dict):
+        """Send a slack event payload to the shard owning its session."""
+        if self._rebalancing is not None:
+            await self._rebalancing
+        key = routing_key(payload) or payload.get("event_id") or ""
+        shard = self.ring.get(key)
+        self.owners[key] = shard
+        self.owners.evict()
+        self.ensure_alive(shard)
+        _, inbox = self.workers[shard]
+        inbox.put(("event", payload))
+
+    def ensure_alive(self, shard: int):
+        """restart a dead worker. it owns the same sessions as before"""
+        process, _ = self.workers[shard]
+        if not process.is_alive():
+            logging.error(f"Shard {shard} is dead, restarting")
+            self._start_worker(shard)
+
+    async def resize(self, num_shards: int):
+        """Add or remove workers, moving sessions to their new owners."""
+        async with self._resizing:
+            await self._resize(num_shards)
+
+    async def scale(self, delta: int):
+        """Add or remove delta workers, counted after the running resize."""
+        async with self._resizing:
+            await self._resize(len(self.ring) + delta)
+
+    async def _resize(self, num_shards: int):
+        if num_shards < 1 or num_shards == len(self.ring):
+            return
+        rebalancing = asyncio.get_running_loop().create_future()
+        self._rebalancing = rebalancing
+        try:
+            current = set(self.ring.nodes)
+            target = set(range(num_shards))
+            for shard in target - current:
+                self._start_worker(shard)
+            new_ring = HashRing(target, replicas=self.ring.replicas)
+
+            # release sessions changing the owner, before the new owner gets them.
+            # workers also release cached sessions routed before the recent ones
+            moved: dict[int, list[str]] = {shard: [] for shard in current & target}
+            adopted: dict[int, list[str]] = {}
+            for key, shard in list(self.owners.items()):
+                new_shard = new_ring.get(key)
+                if new_shard != shard:
+                    moved.setdefault(shard, []).append(key)
+                    adopted.setdefault(new_shard, []).append(key)
+                    self.owners[key] = new_shard
+            await asyncio.gather(
+                *[
+                    self._request(shard, "release", new_ring, keys)
+                    for shard, keys in moved.items()
+                    if shard in target
+                ],
+                *[self._request(shard, "stop") for shard in current - target],
+            )
+            for shard in current - target:
+                process, _ = self.workers.pop(shard)
+                process.join(timeout=10)
+            # new owners know the moved sessions are of the bot
+            await asyncio.gather(
+                *[
+                    self._request(shard, "adopt", keys)
+                    for shard, keys in adopted.items()
+                ]
+            )
+            self.ring = new_ring
+            self.num_shards = num_shards
+        finally:
+            self._rebalancing = None
+            rebalancing.set_result(None)
+
+    async def serve(self, app_token: str):
+        """Receive slack events over socket mode and route them to the workers."""
+        from slack_sdk.socket_mode.response import SocketModeResponse
+        from slack_sdk.socket_mode.websockets import SocketModeClient
+
+        client = SocketModeClient(app_token)
+
+        async def on_request(client: SocketModeClient, request):
+            # ack here, the worker acks nothing
+            await client.send_socket_mode_response(
+                SocketModeResponse(envelope_id=request.envelope_id)
+            )
+            await self.route(request.payload)
+
+        client.socket_mode_request_listeners.append(on_request)
+        await client.connect()
+        try:
+            while True:
+                await asyncio.sleep(1)
+                for shard in list(self.workers):
+                    self.ensure_alive(shard)
+        finally:
+            await client.close()
+
+    async def close(self):
+        """Stop all workers, waiting them to write their sessions."""
+        await asyncio.gather(*[self._request(shard, "stop") for shard in self.workers])
+        for process, _ in self.workers.values():
+            process.join(timeout=10)
+        self.workers = {}
+        self._outbox.put(None)
+        if self._collector is not None:
+            await self._collector
@@ -0,0 +1,86 @@
+import os
+from typing import Any
+
+try:  # optional dependencies for compact snapshots
+    import msgpack
+    import zstandard
+except ImportError:
+    msgpack = None
+    zstandard = None
+
+# layout of session snapshots
+RAW_FORMAT = 1  # messages are stored as they are
+COMPACT_FORMAT = 2  # messages are packed with msgpack and compressed with zstd
+
+# layout of newly written snapshots, "raw" or "compact"
+SNAPSHOT_FORMAT = (
+    COMPACT_FORMAT
+    if os.environ.get("SESSION_SNAPSHOT_FORMAT", "raw") == "compact"
+    else RAW_FORMAT
+)
+
+_compressor = None
+_decompressor = None
+
+
+def _require_compact():
+    if msgpack is None or zstandard is None:
+        raise RuntimeError(
+            "msgpack and zstandard are required for compact snapshots. "
+            "install them with `pip install glados[compact]`"
+        )
+
+
+def pack_messages(messages: list[dict]) -> bytes:
+    """Pack messages into a compressed binary."""
+    global _compressor
+    _require_compact()
+    if _compressor is None:
+        _compressor = zstandard.ZstdCompressor(level=3)
+    return _compressor.compress(msgpack.packb(messages, use_bin_type=True))
+
+
+def unpack_messages(data: bytes) -> list[dict]:
+    """Unpack messages from a compressed binary."""
+    global _decompressor
+    _require_compact()
+    if _decompressor is None:
+        _decompressor = zstandard.ZstdDecompressor()
+    return msgpack.unpackb(_decompressor.decompress(data), raw=False)
+
+
+def snapshot_format(snapshot: dict) -> int:
+    """Get the layout of a snapshot. snapshots without version are raw."""
+    return snapshot.get("format_version", RAW_FORMAT)
+
+
+def read_messages(snapshot: dict) -> list[dict]:
+    """Read messages of a snapshot in any layout."""
+    if snapshot_format(snapshot) == COMPACT_FORMAT:
+        return unpack_messages(snapshot["packed_messages"])
+    return snapshot.get("messages") or []
+
+
+def messages_update(messages: list[dict], format: int = SNAPSHOT_FORMAT) -> dict:
+    """Make an update document replacing messages of a snapshot in the layout."""
+    if format == COMPACT_FORMAT:
+        return {
+            "$set": {
+                "format_version": COMPACT_FORMAT,
+                "packed_messages": pack_messages(messages),
+            },
+            "$unset": {"messages": ""},
+        }
+    return {
+        "$set": {"format_version": RAW_FORMAT, "messages": list(messages)},
+        "$unset": {"packed_messages": ""},
+    }
+
+
+def merge_update(*updates: dict) -> dict[str, Any]:
+    """Merge update documents operator by operator."""
+    merged = {}
+    for update in updates:
+        for operator, fields in update.items():
+            merged.setdefault(operator, {}).update(fields)
+    return merged
@@ -0,0 +1,51 @@
+import os
+from functools import lru_cache
+import tiktoken
+from tiktoken.model import encoding_name_for_model
+
+# encoding used when the model is unknown to tiktoken
+DEFAULT_ENCODING = "cl100k_base"
+
+# tiktoken encoding by model
+TOKENIZERS = {
+    "gpt-3.5-turbo": "cl100k_base",
+    "gpt-3.5-turbo-1106": "cl100k_base",
+    "gpt-4-1106-preview": "cl100k_base",
+    "gpt-4-vision-preview": "cl100k_base",
+    "gpt-4-turbo": "cl100k_base",
+    "gpt-4-turbo-preview": "cl100k_base",
+    "gpt-4o": "o200k_base",
+    "gpt-4o-mini": "o200k_base",
+}
+
+# number of threads used by tiktoken for batch encoding
+NUM_THREADS = int(os.environ.get("TOKENIZER_THREADS", min(8, os.cpu_count() or 1)))
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Get the encoding of a model. Encodings are resolved once per model."""
+    encoding_name = TOKENIZERS.get(model)
+    if encoding_name is None:
+        try:
+            encoding_name = encoding_name_for_model(model)
+        except KeyError:
+            encoding_name = DEFAULT_ENCODING
+    return tiktoken.get_encoding(encoding_name)
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Count the number of tokens in a text."""
+    encoder = get_encoding(model)
+    return len(encoder.encode_ordinary(text))
+
+
+def count_tokens_many(texts: list[str], model: str = "gpt-4") -> list[int]:
+    """Count the number of tokens of each text, encoding them in a batch."""
+    if len(texts) == 0:
+        return []
+    encoder = get_encoding(model)
+    if len(texts) == 1:
+        return [len(encoder.encode_ordinary(texts[0]))]
+    batch = encoder.encode_ordinary_batch(texts, num_threads=NUM_THREADS)
+    return [len(tokens) for tokens in batch]
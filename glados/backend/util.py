@@ -1,8 +1,3 @@
-import tiktoken
+from .tokenizer import count_tokens, count_tokens_many
 
-
-def count_tokens(text: str, model: str = "gpt-4") -> int:
-    """Count the number of tokens in a text."""
-    encoder = tiktoken.encoding_for_model(model)
-    tokens = encoder.encode(text)
-    return len(tokens)
+__all__ = ("count_tokens", "count_tokens_many")
@@ -0,0 +1,93 @@
+import os
+import tempfile
+from typing import Optional
+import numpy as np
+
+
+class VectorIndex:
+    """An in-memory index of vectors searched by cosine similarity.
+
+    vectors are normalized when added, so a search is a single matrix-vector
+    product. rows are kept in a preallocated matrix growing by doubling,
+    so adding or updating a vector does not copy the index.
+    """
+
+    def __init__(self, dim: Optional[int] = None):
+        self.ids: list[str] = []
+        self.positions: dict[str, int] = {}
+        self._matrix = np.zeros((0, dim or 0), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.positions
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._matrix[: len(self.ids)]
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector, axis=-1, keepdims=True)
+        return vector / np.where(norm == 0, 1, norm)
+
+    def upsert(self, id: str, vector):
+        """Add or replace the vector of an id."""
+        vector = self._normalize(vector)
+        if len(self.ids) == 0 and self._matrix.shape[1] != vector.shape[0]:
+            self._matrix = np.zeros((0, vector.shape[0]), dtype=np.float32)
+        position = self.positions.get(id)
+        if position is None:
+            position = len(self.ids)
+            if position == self._matrix.shape[0]:
+                grown = np.zeros(
+                    (max(16, position * 2), self._matrix.shape[1]), dtype=np.float32
+                )
+                grown[:position] = self._matrix
+                self._matrix = grown
+            self.ids.append(id)
+            self.positions[id] = position
+        self._matrix[position] = vector
+
+    def remove(self, id: str):
+        """Remove the vector of an id, moving the last one into its place."""
+        position = self.positions.pop(id, None)
+        if position is None:
+            return
+        last = len(self.ids) - 1
+        if position != last:
+            self._matrix[position] = self._matrix[last]
+            self.ids[position] = self.ids[last]
+            self.positions[self.ids[position]] = position
+        self.ids.pop()
+
+    def search(self, vector, k: int = 1) -> list[tuple[str, float]]:
+        """Find the k most similar ids to the vector, with their scores."""
+        if len(self.ids) == 0:
+            return []
+        scores = self.vectors @ self._normalize(vector)
+        k = min(k, len(self.ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    def save(self, path: str | os.PathLike):
+        """Write the index to a file, replacing it atomically."""
+        path = os.fspath(path)
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+            np.savez(f, ids=np.array(self.ids, dtype=str), vectors=self.vectors)
+        os.replace(f.name, path)
+
+    @classmethod
+    def load(cls, path: str | os.PathLike) -> "VectorIndex":
+        """Read an index from a file."""
+        index = cls()
+        with np.load(path) as data:
+            index.ids = data["ids"].tolist()
+            index._matrix = data["vectors"].astype(np.float32)
+        index.positions = {id: i for i, id in enumerate(index.ids)}
+        return index
@@ -1,6 +1,5 @@
 import os
 import re
-import json
 import asyncio
 import tempfile
 from typing_extensions import override
@@ -27,7 +26,7 @@ from ...assistant import (
     GLaDOS,
     AsyncAssistantEventHandler,
 )
-from ...tool import invoke_function, get_tool_meta
+from ...tool import invoke_tool_call, get_tool_meta, context
 from ...session import SessionManager, Session
 from ...util import is_image_url, make_public_url
 from ...util.file import upload_files
@@ -200,29 +199,38 @@ async def handle_message_events(ack, client, body, event, say, context):
 
     # fill current context
     info = await client.users_info(user=event["user"])
-    session = await SessionManager.get_session(session_id, user=event["user"])
     user_tz = info["user"].get("tz", "UTC")
     current_date = pytz.timezone(user_tz).localize(datetime.fromtimestamp(time.time()))
-    session.context.set(
-        {
-            "platform": "slack",
-            "current_date": current_date.strftime("%Y-%m-%d %H:%M:%S %Z"),
-            "user": event["user"],
-            "display_name": info["user"].get("name", {}),
-            "timezone": user_tz,
-            "channel": event["channel"],
-        }
-    )
-
-    handler = SlackMessageHandler(
-        client, say, session=session, thread_ts=session_id, channel=event.get("channel")
-    )
-    await assistant.chat(
-        prompt,
-        handler=handler,
-        attachments=attachments,
-        session_id=session_id,
-    )
+    runtime_context = {
+        "platform": "slack",
+        "current_date": current_date.strftime("%Y-%m-%d %H:%M:%S %Z"),
+        "user": event["user"],
+        "display_name": info["user"].get("name", {}),
+        "timezone": user_tz,
+        "channel": event["channel"],
+    }
+
+    async def reply():
+        session = await SessionManager.get_session(session_id, user=event["user"])
+        session.context.set(runtime_context)
+
+        handler = SlackMessageHandler(
+            client,
+            say,
+            session=session,
+            thread_ts=session_id,
+            channel=event.get("channel"),
+        )
+        await assistant.chat(
+            prompt,
+            handler=handler,
+            attachments=attachments,
+            session_id=session_id,
+        )
+
+    # messages in a thread are answered one by one, as a thread can't have
+    # more than one active run
+    await SessionManager.run(session_id, reply)
 
 
 file_info_cache = {}
@@ -445,10 +453,13 @@ class SlackMessageHandler(AsyncAssistantEventHandler):
         """When a tool call delta is done, inject the result to the conversation
         and continue with the submitted tool outputs."""
         if tool_call.type == "function":
-            kwargs = json.loads(tool_call.function.arguments)
-            result = await invoke_function(tool_call.function.name, **kwargs)
+            # same timeout, concurrency limit, metrics and output budget as chat
+            context.set(self.session)
+            message = await invoke_tool_call(tool_call)
 
-            self.tool_outputs.append({"tool_call_id": tool_call.id, "output": result})
+            self.tool_outputs.append(
+                {"tool_call_id": tool_call.id, "output": message["content"]}
+            )
 
         elif tool_call.type == "code_interpreter":
             # TODO: implement this ?
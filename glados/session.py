@@ -1,11 +1,22 @@
+import os
+import fcntl
 import json
-from typing import Optional
-from queue import Queue
+import asyncio
+import logging
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Any, Awaitable, Callable, Optional
 from contextvars import ContextVar
 from datetime import datetime, timezone
 from openai import AsyncOpenAI
-from .backend.util import count_tokens
+from pymongo import UpdateOne
+from .backend.tokenizer import count_tokens, count_tokens_many
 from .backend.db import use_db
+from .backend.cache import LRUCache, TTLCache
+from .backend.persistent import WriteBehind
+from .backend import snapshot as snapshots
+from .backend.vector import VectorIndex
+from .backend.actor import Actors
 
 # max recent tokens of session by model
 MAX_TOKENS = {
@@ -15,12 +26,23 @@ MAX_TOKENS = {
     "gpt-4-vision-preview": 7000,
 }
 
-TOKENIZERS = {
-    "gpt-3.5-turbo": "gpt3",
-    "gpt-3.5-turbo-1106": "gpt3",
-    "gpt-4-1106-preview": "gpt4",
-    "gpt-4-vision-preview": "gpt4",
-}
+# condense a session in background when it reaches this ratio of max tokens
+CONDENSE_RATIO = float(os.environ.get("SESSION_CONDENSE_RATIO", 0.8))
+
+# embedding model and file of the index of sessions to resume
+EMBEDDING_MODEL = os.environ.get("SESSION_EMBEDDING_MODEL", "text-embedding-3-small")
+SESSION_INDEX_PATH = os.environ.get("SESSION_INDEX_PATH", ".cache/session_index.npz")
+# minimum similarity of a past session to be resumed
+RESUME_THRESHOLD = float(os.environ.get("SESSION_RESUME_THRESHOLD", 0.5))
+# number of most similar past sessions to look for one of the same user
+RESUME_CANDIDATES = int(os.environ.get("SESSION_RESUME_CANDIDATES", 5))
+
+# rough memory footprint of a token kept in a session
+APPROX_BYTES_PER_TOKEN = 4
+# max number of long tool outputs kept in a session to be read by pages
+MAX_SPILLS = int(os.environ.get("SESSION_MAX_SPILLS", 8))
+# max total bytes of the outputs, as they are written in the session document
+MAX_SPILL_BYTES = int(os.environ.get("SESSION_MAX_SPILL_BYTES", 1 << 20))
 
 current_session = ContextVar("session")
 
@@ -30,6 +52,16 @@ def random_session_id() -> str:
     return str(datetime.now(timezone.utc).timestamp())
 
 
+def dump_message(message: dict) -> str:
+    """Serialize a message as it is counted"""
+    return json.dumps(message, indent=0, separators=(",", ":"))
+
+
+def count_message_tokens(message: dict, model: str) -> int:
+    """Count the number of tokens of a serialized message"""
+    return count_tokens(dump_message(message), model=model)
+
+
 class Session:
     def __init__(
         self,
@@ -48,27 +80,100 @@ class Session:
         self.user = user
         self.context = ContextVar("runtime", default={})
         self.messages = []
+        self.token_counts: list[int] = []  # tokens of each message in messages
+        # running sum of token counts, offsets[i] is tokens up to messages[i].
+        # trimmed messages are accounted in base, so offsets never need rebuilding
+        self._offsets: list[int] = []
+        self._base = 0
+        self.summary: Optional[str] = None  # summary of condensed messages
+        # client to condense the session in background, disabled if None
+        self.condenser: Optional[AsyncOpenAI] = None
+        self._condensing: Optional[asyncio.Task] = None
+        self.dirty = True  # has changes not persisted yet
+        self.unsaved = 0  # number of recent messages not persisted yet
+        self.rewrite = False  # messages are replaced, not just appended
+        # tool outputs too long to be kept in messages, by handle
+        self.spills: dict[str, dict] = {}
+        self.spills_changed = False
         if system_prompt is not None:
             self(system_prompt, role="system")
 
+    @property
+    def max_tokens(self) -> int:
+        """max recent tokens kept in the session"""
+        return MAX_TOKENS.get(self.model, 3000)
+
+    @property
+    def approx_size(self) -> int:
+        """approximate memory footprint of the messages in bytes"""
+        spilled = sum(len(spill["content"]) for spill in self.spills.values())
+        return self.total_tokens * APPROX_BYTES_PER_TOKEN + spilled
+
+    @property
+    def total_tokens(self) -> int:
+        """number of tokens of all messages in the session"""
+        if not self._offsets:
+            return 0
+        return self._offsets[-1] - self._base
+
     def append(self, message: dict):
+        # count tokens of the new message only once, the rest are already known
+        num_tokens = count_message_tokens(message, model=self.model)
         self.messages.append(message)
+        self.token_counts.append(num_tokens)
+        self._offsets.append(
+            (self._offsets[-1] if self._offsets else self._base) + num_tokens
+        )
         self.last_updated = datetime.now(timezone.utc)
+        self.dirty = True
+        self.unsaved += 1
 
-        # remove old messages
-        total_tokens = 0
-        for i, m in enumerate(reversed(self.messages)):
-            message = json.dumps(
-                m, indent=0, separators=(",", ":")
-            )  # XXX: I don't know how to count tokens of a message interactively
-            num_tokens = count_tokens(message, model=self.model)
-            total_tokens += num_tokens
-            if total_tokens > MAX_TOKENS.get(self.model, 3000):
-                del self.messages[-i:]
-                break
-
+        self.trim()
+        self.maybe_condense()
         return self[...]
 
+    def recent_index(self, max_tokens: int) -> int:
+        """index of the oldest message of the most recent max_tokens tokens.
+
+        the most recent message is always included, and tool results are never
+        separated from the assistant message which called the tool.
+        """
+        if not self.messages:
+            return 0
+        # find the first message whose preceding tokens are out of the budget
+        target = self._offsets[-1] - max_tokens
+        if self._base >= target:
+            return 0
+        index = min(bisect_left(self._offsets, target) + 1, len(self.messages) - 1)
+        while index > 0 and self.messages[index].get("role") == "tool":
+            index -= 1
+        return index
+
+    def trim(self):
+        """remove old messages until the session fits in max tokens"""
+        num_drop = self.recent_index(self.max_tokens)
+        if num_drop:
+            self._base = self._offsets[num_drop - 1]
+            del self.messages[:num_drop]
+            del self.token_counts[:num_drop]
+            del self._offsets[:num_drop]
+            self.unsaved = min(self.unsaved, len(self.messages))
+
+    def load_messages(
+        self, messages: list[dict], token_counts: Optional[list[int]] = None
+    ):
+        """replace messages of the session, counting tokens if not given"""
+        if token_counts is None or len(token_counts) != len(messages):
+            token_counts = count_tokens_many(
+                [dump_message(m) for m in messages], model=self.model
+            )
+        self.messages = list(messages)
+        self.token_counts = list(token_counts)
+        self._offsets = list(accumulate(self.token_counts))
+        self._base = 0
+        self.dirty = True
+        self.rewrite = True
+
     def __call__(self, content: str | list | dict, **kwargs):
         if isinstance(content, (str, list)):
             message = {"role": "user", "content": content}
@@ -81,41 +186,88 @@ class Session:
 
     def __getitem__(self, key):
         if key is Ellipsis:  # session[...]
-            # returns recent up to 2000 tokens of message
-            return self.messages  # XXX: implement
-        elif isinstance(key, slice):  # TODO: implement
-            # returns recent up to 2000 tokens of message
-            if isinstance(key.start, int):  # session[1000:...]
-                ...
-                # return recent ~ key.start tokens
+            # returns recent messages up to max tokens of the model
+            return self.messages[self.recent_index(self.max_tokens) :]
+        elif isinstance(key, slice):
+            if isinstance(key.start, int) and key.stop is Ellipsis:  # session[1000:...]
+                # returns recent messages up to key.start tokens
+                return self.messages[self.recent_index(key.start) :]
+            return self.messages[key]
         elif isinstance(key, int):
             return self.messages[key]
 
-    def invoke(self, client, **kwargs):
-        """invoke a chat"""
+    def invoke(self, client, *, context_tokens: Optional[int] = None, **kwargs):
+        """invoke a chat. if context_tokens is given, send recent tokens only"""
         return client.chat.completions.create(
             model=self.model,
-            messages=self[...],
+            messages=self[...] if context_tokens is None else self[context_tokens:...],
             max_tokens=2000,
             user=self.user,
             **kwargs,
         )
 
-    async def invoke_async(self, client, **kwargs):
-        """invoke a chat asynchronously"""
+    async def invoke_async(
+        self, client, *, context_tokens: Optional[int] = None, **kwargs
+    ):
+        """invoke a chat asynchronously. if context_tokens is given, send recent tokens only"""
         # should assert client is async client
         return await client.chat.completions.create(
             model=self.model,
-            messages=self[...],
+            messages=self[...] if context_tokens is None else self[context_tokens:...],
             max_tokens=2000,
             user=self.user,
             **kwargs,
         )
 
+    def spill(self, tool_name: str, content: str, **info) -> str:
+        """Keep a long tool output out of messages, and get the handle to read it.
+        the oldest outputs are dropped over MAX_SPILLS or MAX_SPILL_BYTES,
+        and an output longer than MAX_SPILL_BYTES is cut."""
+        handle = f"{tool_name}-{os.urandom(4).hex()}"
+        data = content.encode()
+        if len(data) > MAX_SPILL_BYTES:
+            content = data[:MAX_SPILL_BYTES].decode(errors="ignore")
+        self.spills[handle] = {"tool": tool_name, "content": content, **info}
+        sizes = {h: len(spill["content"].encode()) for h, spill in self.spills.items()}
+        total = sum(sizes.values())
+        while len(self.spills) > MAX_SPILLS or total > MAX_SPILL_BYTES:
+            oldest = next(iter(self.spills))
+            total -= sizes[oldest]
+            del self.spills[oldest]
+        self.spills_changed = True
+        self.dirty = True
+        return handle
+
+    def maybe_condense(self):
+        """condense the session in background if it is getting full"""
+        if self.condenser is None or self._condensing is not None:
+            return
+        if self.total_tokens < self.max_tokens * CONDENSE_RATIO:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # not in async context
+            return
+        self._condensing = loop.create_task(self.condense(self.condenser))
+        self._condensing.add_done_callback(self._on_condensed)
+
+    def _on_condensed(self, task: asyncio.Task):
+        self._condensing = None
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(
+                f"Error while condensing session {self.id}", exc_info=task.exception()
+            )
+
     async def condense(self, client: AsyncOpenAI):
-        """make a condensed version of session"""
+        """make a condensed version of session.
+        old messages are replaced with their summary, recent half of max tokens
+        are kept as they are."""
+        num_old = self.recent_index(self.max_tokens // 2)
+        if num_old == 0:
+            return
+        old_messages = self.messages[:num_old]
         recent_conversation = "\n".join(
-            f"<{message['role']}> {message['content']}" for message in self.messages
+            f"<{message['role']}> {message.get('content')}" for message in old_messages
         )
         prompt = (
             "This is recent conversation with AI assistant: \n\n"
@@ -126,26 +278,42 @@ class Session:
             "Use the most common language of the conversation."
         )
         result = await client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model="gpt-4o-mini",
             messages=[
                 {
                     "role": "system",
-                    "content": "You are a programming interface, outputs JSON.",
+                    "content": "You summarize conversations.",
                 },
-                {"role": "user", "text": prompt},
+                {"role": "user", "content": prompt},
             ],
             temperature=0.2,
-            max_tokens=2000,
-            output_type="json_object",
+            # with the recent half, stays under the ratio to condense again
+            max_tokens=max(1, int(self.max_tokens * (1 - CONDENSE_RATIO))),
         )
-        self.messages = [
+        self.summary = result.choices[0].message.content
+        summary_messages = [
             {
                 "role": "user",
                 "content": "Please summarize the recent conversation",
             },
-            {"role": "assistant", "content": result.choices[0].content},
+            {"role": "assistant", "content": self.summary},
         ]
 
+        # messages may be appended or trimmed while summarizing.
+        # replace the summarized messages still left in the session.
+        last_message = old_messages[-1]
+        num_summarized = next(
+            (i + 1 for i, m in enumerate(self.messages) if m is last_message), 0
+        )
+        self.load_messages(
+            summary_messages + self.messages[num_summarized:],
+            [count_message_tokens(m, self.model) for m in summary_messages]
+            + self.token_counts[num_summarized:],
+        )
+        # the chat may be saved already, write the summary too
+        if SessionManager.sessions.peek(self.id) is self:
+            SessionManager.writer.mark(self.id, self)
+
     def retrive(self, session_id: str):
         """retrieve session snapshot"""
         ...
@@ -159,8 +327,17 @@ class Session:
         )
         instance.thread_id = snapshot.get("thread_id")
         instance.vector_store_id = snapshot.get("vector_store_id")
+        instance.summary = snapshot.get("summary")
+        instance.spills = snapshot.get("spills") or {}
         instance.last_updated = snapshot.get("last_updated")
-        instance.messages = snapshot.get("messages")
+        instance.load_messages(
+            snapshots.read_messages(snapshot), snapshot.get("token_counts")
+        )
+        instance.dirty = False
+        # snapshot in another layout is rewritten entirely on next write
+        instance.rewrite = (
+            snapshots.snapshot_format(snapshot) != snapshots.SNAPSHOT_FORMAT
+        )
         return instance
 
     def to_dict(self):
@@ -169,16 +346,119 @@ class Session:
             "session_id": self.id,
             "thread_id": self.thread_id,
             "vector_store_id": self.vector_store_id,
+            "summary": self.summary,
             "last_updated": self.last_updated.isoformat(),
             "model": self.model,
             "user": self.user,
             "messages": self.messages,
+            "token_counts": self.token_counts,
+            "spills": self.spills,
         }
 
 
+def session_subject(session: Session) -> Optional[str]:
+    """text representing a session, to find it by similarity"""
+    if session.summary:
+        return session.summary
+    for message in session.messages:
+        if message.get("role") == "user" and isinstance(message.get("content"), str):
+            return message["content"]
+    return None
+
+
+def make_session_update(session: Session) -> UpdateOne:
+    """make a write operation of the changes of the session.
+
+    new messages are appended to the stored ones, keeping as many as
+    the session has, so the write is proportional to the change.
+    compact snapshots are rewritten entirely when messages are changed.
+    """
+    update = {
+        "$set": {
+            "thread_id": session.thread_id,
+            "vector_store_id": session.vector_store_id,
+            "summary": session.summary,
+            "last_updated": session.last_updated,
+            "model": session.model,
+            "user": session.user,
+        }
+    }
+    if session.rewrite or session.spills_changed:
+        update["$set"]["spills"] = dict(session.spills)
+    compact = snapshots.SNAPSHOT_FORMAT == snapshots.COMPACT_FORMAT
+    if session.rewrite or (compact and session.unsaved):
+        # packed messages can't be appended, they are written entirely
+        update = snapshots.merge_update(
+            update,
+            snapshots.messages_update(session.messages, snapshots.SNAPSHOT_FORMAT),
+            {"$set": {"token_counts": list(session.token_counts)}},
+        )
+    elif session.unsaved:
+        num_messages = len(session.messages)
+        update["$push"] = {
+            "messages": {
+                "$each": session.messages[-session.unsaved :],
+                "$slice": -num_messages,
+            },
+            "token_counts": {
+                "$each": session.token_counts[-session.unsaved :],
+                "$slice": -num_messages,
+            },
+        }
+    session.dirty = False
+    session.unsaved = 0
+    session.rewrite = False
+    session.spills_changed = False
+    return UpdateOne({"session_id": session.id}, update, upsert=True)
+
+
+def rollback_session_update(session: Session):
+    """the write is failed. write entire messages on next time"""
+    session.dirty = True
+    session.rewrite = True
+
+
 class SessionManager:
-    sessions = {}
-    queue = Queue()
+    # recently used sessions kept in memory
+    sessions = LRUCache(
+        int(os.environ.get("SESSION_CACHE_SIZE", 100)),
+        maxweight=(
+            int(os.environ["SESSION_CACHE_BYTES"])
+            if "SESSION_CACHE_BYTES" in os.environ
+            else None
+        ),
+        weigh=lambda session: session.approx_size,
+    )
+    # sessions waiting to be written to database
+    writer = WriteBehind(
+        "sessions",
+        make_session_update,
+        rollback=rollback_session_update,
+        interval=float(os.environ.get("SESSION_FLUSH_INTERVAL", 1.0)),
+        batch_size=int(os.environ.get("SESSION_FLUSH_SIZE", 100)),
+    )
+    # ids of stored sessions, complete once the index is loaded
+    known: set[str] = set()
+    indexed = False
+    # False when other processes create sessions, so the index is never complete
+    trust_index = True
+    # ids recently found not to be sessions, when the index is not trusted
+    missing = TTLCache(
+        int(os.environ.get("SESSION_MISS_CACHE_SIZE", 10000)),
+        ttl=float(os.environ.get("SESSION_MISS_TTL", 30)),
+    )
+    # client to condense long sessions in background, disabled if None
+    condenser: Optional[AsyncOpenAI] = None
+    # client to embed sessions for resuming, disabled if None
+    embedder: Optional[AsyncOpenAI] = None
+    # embeddings of session subjects, and hash of the embedded subjects
+    index = VectorIndex()
+    indexed_subjects: dict[str, int] = {}
+    tasks: set[asyncio.Task] = set()
+    # sessions being loaded, to share a load between concurrent requests
+    loading: dict[str, asyncio.Future] = {}
+    # jobs of each session run in order, different sessions run concurrently
+    actors = Actors(idle_timeout=float(os.environ.get("SESSION_ACTOR_IDLE", 60)))
     pid = None
 
     @classmethod
@@ -193,84 +473,245 @@ class SessionManager:
 
     @staticmethod
     async def save_session(session_id: str):
-        """persist session snapshot"""
-        db = use_db()
-        col = db.get_collection("sessions")
-
-        session = SessionManager.sessions.get(session_id)
+        """persist session snapshot.
+        the snapshot is written in background with other changed sessions."""
+        session = SessionManager.sessions.peek(
+            session_id
+        ) or SessionManager.writer.get(session_id)
         if session is None:
             raise ValueError(f"session {session_id} not found")
-            return
 
-        await col.update_one(
-            {"session_id": session.id},
-            {
-                "$set": {
-                    "thread_id": session.thread_id,
-                    "vector_store_id": session.vector_store_id,
-                    "last_updated": session.last_updated,
-                    "model": session.model,
-                    "user": session.user,
-                    "messages": session.messages,
-                }
-            },
-            upsert=True,
+        SessionManager.writer.mark(session_id, session)
+        SessionManager.index_in_background(session)
+
+    @staticmethod
+    async def embed(texts: list[str]):
+        """get embeddings of texts"""
+        response = await SessionManager.embedder.embeddings.create(
+            input=texts, model=EMBEDDING_MODEL
         )
+        return [data.embedding for data in response.data]
+
+    @staticmethod
+    def index_in_background(session: Session):
+        """update the embedding of the session if its subject is changed"""
+        if SessionManager.embedder is None:
+            return
+        subject = session_subject(session)
+        if not subject or SessionManager.indexed_subjects.get(session.id) == hash(
+            subject
+        ):
+            return
+        SessionManager.indexed_subjects[session.id] = hash(subject)
+
+        async def index_session():
+            try:
+                [vector] = await SessionManager.embed([subject])
+                SessionManager.index.upsert(session.id, vector)
+            except Exception as exc:
+                SessionManager.indexed_subjects.pop(session.id, None)
+                logging.error(f"Error while indexing session {session.id}", exc_info=exc)
+
+        task = asyncio.create_task(index_session())
+        SessionManager.tasks.add(task)
+        task.add_done_callback(SessionManager.tasks.discard)
+
+    @staticmethod
+    def load_vectors(path: Optional[str] = None):
+        """load embeddings of sessions from the file, if exists"""
+        path = path or SESSION_INDEX_PATH
+        if os.path.exists(path):
+            SessionManager.index = VectorIndex.load(path)
+
+    @staticmethod
+    def save_vectors(path: Optional[str] = None):
+        """save embeddings of sessions indexed by this process to the file.
+        shard workers share the file, so they are merged with the saved ones"""
+        path = path or SESSION_INDEX_PATH
+        index = SessionManager.index
+        indexed = [id for id in SessionManager.indexed_subjects if id in index]
+        if not indexed:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # one process merges at a time
+            saved = VectorIndex.load(path) if os.path.exists(path) else VectorIndex()
+            for id in indexed:
+                saved.upsert(id, index.vectors[index.positions[id]])
+            saved.save(path)
+
+    @staticmethod
+    async def run(session_id: str, job: Callable[[], Awaitable[Any]]) -> Any:
+        """Run a job of a session after the jobs of the session sent before."""
+        return await SessionManager.actors.run(session_id, job)
+
+    @staticmethod
+    def queue_depth(session_id: str) -> int:
+        """number of jobs of a session waiting or running"""
+        return SessionManager.actors.depth(session_id)
+
+    @staticmethod
+    async def flush():
+        """write all changed sessions to database now"""
+        await SessionManager.writer.flush()
+
+    @staticmethod
+    async def close():
+        """write all changed sessions and stop writing in background.
+        should be called on shutdown."""
+        await SessionManager.actors.close()
+        for session_id, session in SessionManager.sessions.items():
+            if session.dirty:
+                SessionManager.writer.mark(session_id, session)
+        await SessionManager.writer.close()
+        SessionManager.save_vectors()
+
+    @staticmethod
+    def evict_sessions():
+        """Drop least recently used sessions exceeding the capacity of memory.
+        unsaved sessions are kept by the writer until they are written."""
+        for session_id, session in SessionManager.sessions.evict():
+            if session.dirty:
+                SessionManager.writer.mark(session_id, session)
+
+    @staticmethod
+    def stats() -> dict:
+        """Get the counters of in-memory sessions"""
+        return {
+            **SessionManager.sessions.stats(),
+            **SessionManager.writer.stats(),
+            "actors": len(SessionManager.actors.actors),
+            "queued": sum(SessionManager.actors.depths().values()),
+        }
+
+    @staticmethod
+    async def load_index():
+        """Load ids of all stored sessions,
+        so that has_session answers without querying database."""
+        db = use_db()
+        col = db.get_collection("sessions")
+        async for snapshot in col.find({}, {"session_id": 1, "_id": 0}):
+            SessionManager.known.add(snapshot["session_id"])
+        SessionManager.indexed = True
+        SessionManager.missing.clear()
 
     @staticmethod
     async def has_session(session_id: str) -> bool:
         """Check if session exists in database"""
         if session_id in SessionManager.sessions:
             return True
+        if session_id in SessionManager.known:
+            return True
+        if SessionManager.writer.get(session_id) is not None:
+            return True
+        if SessionManager.indexed and SessionManager.trust_index:
+            return False  # every session is known
+        if session_id in SessionManager.missing:
+            return False
         db = use_db()
         col = db.get_collection("sessions")
-        return await col.count_documents({"session_id": session_id}) > 0
+        if await col.count_documents({"session_id": session_id}) > 0:
+            SessionManager.known.add(session_id)
+            return True
+        SessionManager.missing[session_id] = True
+        return False
 
     @staticmethod
     async def get_session(
         session_id, model="gpt-4-turbo", user: Optional[str] = None
     ) -> Session:
         """Get a session. if not exists, create one."""
-        # gabage collection if number of sessions exceeds 100 for saving memory
-        if len(SessionManager.sessions) > 100:
-            sorted_sessions = sorted(
-                SessionManager.sessions.items(),
-                key=lambda item: item[1].last_updated,
-                reverse=True,
+        session = SessionManager.sessions.get(session_id)
+        if session is not None:
+            return session
+
+        # concurrent requests of a session wait for the same load
+        loading = SessionManager.loading.get(session_id)
+        if loading is None:
+            loading = asyncio.ensure_future(
+                SessionManager.load_session(session_id, model=model, user=user)
             )
-            # delete sessions except for 100 most recent sessions
-            for k, _ in sorted_sessions[100:]:
-                SessionManager.clear_session(k)
+            SessionManager.loading[session_id] = loading
 
-        if session_id not in SessionManager.sessions:
+            def done(future):
+                if SessionManager.loading.get(session_id) is future:
+                    del SessionManager.loading[session_id]
+
+            loading.add_done_callback(done)
+        # a cancelled request should not cancel the load for the others
+        return await asyncio.shield(loading)
+
+    @staticmethod
+    async def load_session(
+        session_id, model="gpt-4-turbo", user: Optional[str] = None
+    ) -> Session:
+        """Load a session into memory. if not exists, create one."""
+        session = SessionManager.writer.get(session_id)
+        if session is None:
             # try to retrieve session from snapshot
             db = use_db()
             col = db.get_collection("sessions")
             snapshot = await col.find_one({"session_id": session_id})
             if snapshot is not None:
-                SessionManager.sessions[session_id] = Session.from_snapshot(snapshot)
-            else:  # create a new session
-                SessionManager.sessions[session_id] = Session(
-                    session_id, model=model, user=user
-                )
-                await col.insert_one(SessionManager.sessions[session_id].to_dict())
-
-        return SessionManager.sessions[session_id]
+                session = Session.from_snapshot(snapshot)
+            else:  # create a new session, written in background
+                session = Session(session_id, model=model, user=user)
+                SessionManager.writer.mark(session_id, session)
+
+        session.condenser = SessionManager.condenser
+        SessionManager.known.add(session_id)
+        SessionManager.missing.pop(session_id)
+        SessionManager.sessions[session_id] = session
+        # drop old sessions for saving memory
+        SessionManager.evict_sessions()
+        return session
 
     @staticmethod
-    def resume_session(session_id, subject: str):
-        """Resume a session. if session is not in memory, retrieve from snapshot."""
-        # TODO
-        # get embeddings of subject
-        # search for similar session
-        # if found, retrieve session
-        # if needed, summarize session conversation
-        # make a new session from snapshot
-        # return session
-        ...
+    async def resume_session(
+        session_id, subject: str, user: Optional[str] = None
+    ) -> Session:
+        """Resume a session. find the most similar past session of the user for
+        the subject, and start the session with the context of the past one."""
+        session = await SessionManager.get_session(session_id, user=user)
+        if SessionManager.embedder is None or len(SessionManager.index) == 0:
+            return session
+
+        [vector] = await SessionManager.embed([subject])
+        # the index has sessions of every user, check a few most similar ones
+        for past_id, score in SessionManager.index.search(vector, k=RESUME_CANDIDATES):
+            if score < RESUME_THRESHOLD:
+                return session
+            if past_id == session_id:
+                continue
+            past = SessionManager.sessions.peek(past_id) or SessionManager.writer.get(
+                past_id
+            )
+            if past is None:
+                col = use_db().get_collection("sessions")
+                snapshot = await col.find_one({"session_id": past_id})
+                if snapshot is None:  # the session is gone
+                    SessionManager.index.remove(past_id)
+                    continue
+                past = Session.from_snapshot(snapshot)
+            if past.user == session.user:
+                break
+        else:
+            return session
+
+        if past.summary:
+            session(
+                {
+                    "role": "user",
+                    "content": "Please summarize the recent conversation",
+                }
+            )
+            session(past.summary, role="assistant")
+        else:
+            for message in past[session.max_tokens // 2 : ...]:
+                session(dict(message))
+        return session
 
     @staticmethod
     def clear_session(session_id):
         """Clear a session if exists."""
-        if session_id in SessionManager.sessions:
-            del SessionManager.sessions[session_id]
+        SessionManager.sessions.pop(session_id)
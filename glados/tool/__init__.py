@@ -1,23 +1,58 @@
 import os
-import glob
-import importlib.util
+import asyncio
+import importlib
+import functools
 import inspect
 import json
 import logging
+import re
+import time
+import weakref
 from typing import Optional, TypedDict, Callable
 from contextvars import ContextVar
 from openai.types.chat.chat_completion_chunk import ChoiceDeltaToolCall
 from function_schema import get_function_schema
-from ..assistant import AsyncOpenAI
+from ..backend.cache import TTLCache
+from ..backend.client import use_openai
+from ..backend.executor import run_in_executor
+from ._router import ROUTER_MODE, ToolRouter
+from ._metrics import ToolMetrics
+from ._output import DEFAULT_MAX_TOKENS, budget_output
+from ._cache import RESULT_CACHE_DB, SCOPES, ResultCache, cacheable, scope_id
+from ._manifest import USE_MANIFEST, LazyEntry, load_manifest, tool_modules
 from ..session import Session
 
 __registry__ = {}
+registry_version = 0  # increases whenever a tool is registered
 context = ContextVar("session")
 
+# seconds to wait a tool when the plugin does not declare its own timeout
+DEFAULT_TIMEOUT = float(os.environ.get("GLADOS_TOOL_TIMEOUT", 60))
+
 
 class PluginMeta(TypedDict):
     name: Optional[str]
     icon: Optional[str]
+    timeout: Optional[float]  # seconds to wait the tool
+    concurrency: Optional[int]  # max number of calls running at once
+    executor: Optional[str]  # "thread" or "process" to run a sync function in
+    cache_ttl: Optional[float]  # seconds to reuse a result for the same arguments
+    cache_scope: Optional[str]  # share cached results "global"ly, per "user" or "session"
+    max_tokens: Optional[int]  # max tokens of a result kept in a session, 0 for no limit
+
+
+BUILTIN_TOOLS = ("code_interpreter", "file_search")
+
+
+def canonical_json(value) -> str:
+    """serialize a value the same way every time"""
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def tool_payload(schema: dict) -> dict:
+    """the chat completion tools parameter of a schema, with keys sorted.
+    the api serializes dicts in insertion order, so the request bytes are stable."""
+    return json.loads(canonical_json({"type": "function", "function": schema}))
 
 
 def plugin(fn: Optional[Callable] = None, **meta: PluginMeta):
@@ -25,37 +60,51 @@ def plugin(fn: Optional[Callable] = None, **meta: PluginMeta):
 
     if not fn or not callable(fn):
         return lambda fn: plugin(fn, **meta)
+    if meta.get("cache_scope", "global") not in SCOPES:
+        raise ValueError(f"cache_scope should be one of {SCOPES}")
 
+    global registry_version
+    schema = get_function_schema(fn)
+    registered = __registry__.get(fn.__name__)
+    # importing a plugin listed in the manifest does not change the registry
+    if registered is None or (registered["meta"], registered["schema"]) != (
+        meta,
+        schema,
+    ):
+        registry_version += 1
     __registry__[fn.__name__] = {
         "function": fn,
         "meta": meta,
-        "schema": get_function_schema(fn),
+        "schema": schema,
+        "payload": tool_payload(schema),
     }
-    print(f"Registerd tool {fn.__name__}")
+    fn.__meta__ = meta
+    logging.debug(f"Registered tool {fn.__name__}")
 
     return fn
 
 
-# Load all tools
-current_dir = os.path.dirname(os.path.realpath(__file__))
-py_files = glob.glob(os.path.join(current_dir, "*.py"))
-
-for py_file in py_files:
-    # Skip if the file is the current file
-    if py_file == __file__:
-        continue
+def load_tools():
+    """Register all tools, from the manifest if it is up to date.
+    otherwise import all tool modules."""
+    manifest = load_manifest() if USE_MANIFEST else None
+    if manifest is not None:
+        for tool_name, entry in manifest["plugins"].items():
+            __registry__[tool_name] = LazyEntry(
+                __registry__, tool_name, payload=tool_payload(entry["schema"]), **entry
+            )
+        return
+    if USE_MANIFEST:
+        logging.info(
+            "Tool manifest is missing or out of date, importing all tool modules. "
+            "run `python -m glados.tool._manifest` to rebuild it"
+        )
+    for module in tool_modules():
+        # import as a submodule, so a process pool can find the functions by name
+        importlib.import_module(module)
 
-    module_name = os.path.splitext(os.path.basename(py_file))[0]
-    # Skip if the module name starts with '_'
-    if module_name.startswith("_"):
-        continue
-    module_path = os.path.abspath(py_file)  # Get the absolute path of the module
 
-    spec = importlib.util.spec_from_file_location(
-        module_name, module_path
-    )  # Use the absolute path
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+load_tools()
 
 
 async def noop(**kwargs):
@@ -75,67 +124,221 @@ async def invoke_function(function_name: str, **kwargs):
 
     even if the function is not found, it should not raise an error, but return a message that the function is not found.
     if the function is corountine, it automatically awaits it.
+    otherwise it runs in the thread pool, or in the process pool for a plugin
+    with `executor="process"`, not to block the event loop.
     """
-    tool = __registry__.get(function_name, {"function": noop})
+    tool = __registry__.get(function_name, {"function": noop, "meta": {}})
+    meta = tool["meta"]
+    key = None
+    if meta.get("cache_ttl"):
+        key = result_cache.key(function_name, meta.get("cache_scope", "global"), kwargs)
+        if key is not None and (cached := await result_cache.get(key)) is not None:
+            return cached
     if inspect.iscoroutinefunction(tool["function"]):
         ret = await tool["function"](**kwargs)
     else:
-        ret = tool["function"](**kwargs)
-    return json.dumps(ret)
+        executor = meta.get("executor", "thread")
+        ret = await run_in_executor(
+            functools.partial(tool["function"], **kwargs), executor=executor
+        )
+    result = json.dumps(ret)
+    if key is not None and cacheable(ret):
+        await result_cache.set(key, result, meta["cache_ttl"])
+    return result
+
+
+result_cache = ResultCache(use_database=RESULT_CACHE_DB)
+
+
+async def invalidate_results(
+    tool_name: Optional[str] = None, scope: Optional[str] = None
+):
+    """Drop cached results of a tool, or all tools.
+    with a scope, drop only the results of the current user or session."""
+    owner = None if scope is None else scope_id(scope)
+    await result_cache.invalidate(tool_name, owner)
+
 
+def result_stats() -> dict:
+    """Get hits and misses of cached results of each tool."""
+    return result_cache.stats()
 
-async def invoke_tool_calls(tool_calls: list[ChoiceDeltaToolCall]):
-    """Invoke tool functions by tool_calls messages."""
-    messages = []
 
-    # to make things simple, call functions one by one now.
-    # TODO: make it parallel
-    for tool_call in tool_calls:
+# semaphores of tools by event loop, as a semaphore works in one loop only
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = (
+    weakref.WeakKeyDictionary()
+)
+metrics = ToolMetrics()
+
+
+def tool_stats() -> dict[str, dict]:
+    """Get calls, latency percentiles, failures and result sizes of each tool."""
+    return metrics.to_dict()
+
+
+def get_semaphore(tool_name: str) -> Optional[asyncio.Semaphore]:
+    """Get the semaphore limiting concurrent calls of a tool, if it has a limit."""
+    concurrency = get_tool_meta(tool_name).get("concurrency")
+    if not concurrency:
+        return None
+    semaphores = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    if tool_name not in semaphores:
+        semaphores[tool_name] = asyncio.Semaphore(concurrency)
+    return semaphores[tool_name]
+
+
+async def invoke_tool_call(tool_call: ChoiceDeltaToolCall | dict) -> dict:
+    """Invoke a tool function by a tool_call message, an object or a dict.
+
+    it never raises, an error or a timeout becomes the content of the message.
+    """
+    if isinstance(tool_call, dict):
+        assert tool_call["type"] == "function"
+        tool_call_id = tool_call["id"]
+        function_name = tool_call["function"]["name"]
+        arguments = tool_call["function"]["arguments"]
+    else:
         assert tool_call.type == "function"
         tool_call_id = tool_call.id
-        function = tool_call.function
-        function_name = function.name
-        try:
-            kwargs = json.loads(function.arguments)
-        except Exception:
-            kwargs = {}
-        try:
-            result = await invoke_function(function_name, **kwargs)
-        except Exception as exc:
-            result = "Error: " + str(
-                exc
-            )  # don't raise an error, but return a message when something goes wrong
-            logging.error(f"Error while invoking tool {function_name}", exc_info=exc)
-        messages.append(
-            {
-                "role": "tool",
-                "tool_call_id": tool_call_id,
-                "name": function_name,
-                "content": result,
-            }
-        )
-    return messages
+        function_name = tool_call.function.name
+        arguments = tool_call.function.arguments
+    try:
+        kwargs = json.loads(arguments)
+    except Exception:
+        kwargs = {}
+    timeout = get_tool_meta(function_name).get("timeout", DEFAULT_TIMEOUT)
+    semaphore = get_semaphore(function_name)
+    status = "ok"
+    try:
+        if semaphore is None:
+            started = time.perf_counter()
+            result = await asyncio.wait_for(
+                invoke_function(function_name, **kwargs), timeout
+            )
+        else:
+            async with semaphore:
+                started = time.perf_counter()
+                result = await asyncio.wait_for(
+                    invoke_function(function_name, **kwargs), timeout
+                )
+    except asyncio.TimeoutError:
+        status = "timeout"
+        result = f"Error: {function_name} timed out after {timeout} seconds"
+        logging.error(f"Timeout while invoking tool {function_name}")
+    except Exception as exc:
+        status = "error"
+        result = "Error: " + str(
+            exc
+        )  # don't raise an error, but return a message when something goes wrong
+        logging.error(f"Error while invoking tool {function_name}", exc_info=exc)
+    metrics.record(
+        function_name, time.perf_counter() - started, status, len(result.encode())
+    )
+    max_tokens = get_tool_meta(function_name).get("max_tokens", DEFAULT_MAX_TOKENS)
+    if max_tokens:
+        result = budget_output(function_name, result, max_tokens, context.get(None))
+    return {
+        "role": "tool",
+        "tool_call_id": tool_call_id,
+        "name": function_name,
+        "content": result,
+    }
+
+
+async def invoke_tool_calls(tool_calls: list[ChoiceDeltaToolCall | dict]):
+    """Invoke tool functions by tool_calls messages, all at once.
+
+    the messages are in the same order as the tool calls.
+    """
+    return list(await asyncio.gather(*map(invoke_tool_call, tool_calls)))
 
 
 def format_tools(tool_names: list[str]) -> list[dict] | None:
-    """Format tool names as chat completion tools parameter."""
-    if len(tool_names) == 0:
-        return None
+    """Format tool names as chat completion tools parameter.
+
+    tools are sorted by name and unknown names are dropped, so the same tools
+    make the same request prefix and hit the prompt cache of the provider.
+    """
+    tools = []
+    for tool_name in sorted(set(tool_names)):
+        if tool_name in BUILTIN_TOOLS:
+            tools.append({"type": tool_name})
+        elif tool_name in __registry__:
+            tools.append(__registry__[tool_name]["payload"])
+    return tools or None
+
+
+def prompt_prefix(system: Optional[str], tool_names: list[str]) -> bytes:
+    """Get the bytes of a system prompt and tools, as stable as the request prefix."""
+    return canonical_json(
+        {"system": system, "tools": format_tools(tool_names) or []}
+    ).encode()
+
+
+router = ToolRouter()
 
-    def get_tool(tool_name):
-        if tool_name in ("code_interpreter", "file_search"):
-            return {"type": tool_name}
-        tool = __registry__.get(tool_name)
-        if tool is None:
-            return None
-        return {"type": "function", "function": tool["schema"]}
+# tool names chosen for recent messages, by registry version and normalized message
+selection_cache = TTLCache(
+    int(os.environ.get("GLADOS_TOOL_SELECTION_CACHE_SIZE", 1000)),
+    ttl=float(os.environ.get("GLADOS_TOOL_SELECTION_TTL", 3600)),
+)
 
-    return [get_tool(tool_name) for tool_name in set(tool_names)]
+URL_PATTERN = re.compile(r"<?https?://[^\s>]+>?")
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,:/-]\d+)*")
 
 
-async def choose_tools(message: str) -> list[dict] | None:
+def message_text(message: str | list) -> str:
+    """the text of a message, or of its text blocks with a mark of other blocks"""
+    if isinstance(message, str):
+        return message
+    return " ".join(
+        block["text"] if block.get("type") == "text" else f"<{block.get('type')}>"
+        for block in message
+    )
+
+
+def normalize_message(message: str | list) -> str:
+    """a message without what does not change tools to choose,
+    like urls, numbers, case and spaces"""
+    message = URL_PATTERN.sub("<url>", message_text(message).lower())
+    message = NUMBER_PATTERN.sub("<num>", message)
+    return " ".join(message.split()).rstrip("?!. ")
+
+
+def selection_stats() -> dict:
+    """Get the counters of the tool selection cache."""
+    stats = selection_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    return {**stats, "hit_rate": stats["hits"] / lookups if lookups else 0.0}
+
+
+async def choose_tools(message: str | list) -> list[dict] | None:
     """automatically choose tools from a message."""
-    ai = AsyncOpenAI()
+    key = (registry_version, normalize_message(message))
+    tool_names = selection_cache.get(key)
+    if tool_names is None:
+        tool_names = await choose_tool_names(message)
+        if tool_names is not None:
+            selection_cache[key] = tool_names
+    return format_tools(tool_names or [])
+
+
+async def choose_tool_names(message: str | list) -> list[str] | None:
+    """choose tool names for a message, or None when failed."""
+    if ROUTER_MODE == "embedding":
+        try:
+            tool_names = await router.route(message_text(message), __registry__)
+        except Exception as exc:
+            logging.error("Error while routing tools", exc_info=exc)
+            tool_names = None
+        if tool_names is not None:
+            return tool_names
+    return await ask_tool_names(message)
+
+
+async def ask_tool_names(message: str | list) -> list[str] | None:
+    """ask a chat model which tools a message needs."""
+    ai = use_openai()
     tool_names = "\n".join(
         [
             f"- {tool_name}: {impl['schema'].get('description', tool_name)}"
@@ -160,5 +363,5 @@ async def choose_tools(message: str) -> list[dict] | None:
         response_json = json.loads(response.choices[0].message.content)
         tool_names = response_json.get("tools", [])
     except Exception:  # XXX
-        return []
-    return format_tools(tool_names)
+        return None
+    return tool_names
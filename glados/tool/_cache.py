@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+from ..backend.cache import TTLCache
+from ..backend.db import use_db
+from ..session import Session, current_session
+
+RESULT_CACHE_SIZE = int(os.environ.get("GLADOS_TOOL_CACHE_SIZE", 1000))
+# set 1 to share cached results between processes and restarts through database
+RESULT_CACHE_DB = os.environ.get("GLADOS_TOOL_CACHE_DB") == "1"
+SCOPES = ("global", "user", "session")
+
+
+def scope_id(scope: str) -> Optional[str]:
+    """the id of the current user or session, or None if it is unknown"""
+    if scope == "global":
+        return "*"
+    from . import context  # the session of the task invoking the tool
+
+    session = context.get(None) or current_session.get(None)
+    if not isinstance(session, Session):
+        return None
+    return (session.user if scope == "user" else session.id) or None
+
+
+class ResultCache:
+    """Results of plugins by their arguments, in memory and optionally in database.
+
+    a result is cached for `cache_ttl` seconds of the plugin, shared by every
+    call in its `cache_scope`: all calls, calls of a user, or calls of a session.
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, *, use_database: bool = False):
+        self.memory = TTLCache(maxsize, ttl=60)
+        self.use_database = use_database
+        self.counts: dict[str, dict[str, int]] = {}
+        self._indexed = False
+
+    @staticmethod
+    def key(tool_name: str, scope: str, kwargs: dict) -> Optional[tuple]:
+        """Get the key of a call, or None if the call can't be cached in the scope."""
+        owner = scope_id(scope)
+        if owner is None:
+            return None
+        arguments = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+        digest = hashlib.blake2b(arguments.encode(), digest_size=16).hexdigest()
+        return (tool_name, owner, digest)
+
+    def _count(self, tool_name: str, counter: str):
+        counts = self.counts.setdefault(tool_name, {"hits": 0, "misses": 0})
+        counts[counter] += 1
+
+    def _collection(self):
+        return use_db().get_collection("tool_results")
+
+    async def get(self, key: tuple) -> Optional[str]:
+        """Get a cached result, or None."""
+        result = self.memory.get(key)
+        if result is None and self.use_database:
+            now = datetime.now(timezone.utc)
+            document = await self._collection().find_one(
+                {"_id": "/".join(key), "expires_at": {"$gt": now}}
+            )
+            if document is not None:
+                result = document["result"]
+                expires_at = document["expires_at"].replace(tzinfo=timezone.utc)
+                self.memory.set(key, result, ttl=(expires_at - now).total_seconds())
+        self._count(key[0], "misses" if result is None else "hits")
+        return result
+
+    async def set(self, key: tuple, result: str, ttl: float):
+        self.memory.set(key, result, ttl=ttl)
+        if not self.use_database:
+            return
+        collection = self._collection()
+        if not self._indexed:
+            # let database drop expired results
+            await collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+        tool_name, owner, _ = key
+        await collection.update_one(
+            {"_id": "/".join(key)},
+            {
+                "$set": {
+                    "tool": tool_name,
+                    "owner": owner,
+                    "result": result,
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl),
+                }
+            },
+            upsert=True,
+        )
+
+    async def invalidate(self, tool_name: Optional[str] = None, owner: Optional[str] = None):
+        """Drop cached results of a tool, or all tools, of an owner or all owners."""
+        for key in list(self.memory):
+            if tool_name in (None, key[0]) and owner in (None, key[1]):
+                self.memory.pop(key)
+        if self.use_database:
+            filter = {}
+            if tool_name is not None:
+                filter["tool"] = tool_name
+            if owner is not None:
+                filter["owner"] = owner
+            await self._collection().delete_many(filter)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Get hits and misses of each tool."""
+        return {
+            tool_name: {
+                **counts,
+                "hit_rate": counts["hits"] / max(1, counts["hits"] + counts["misses"]),
+            }
+            for tool_name, counts in self.counts.items()
+        }
+
+
+def cacheable(result: Any) -> bool:
+    """plugins report failures as {"error": ...}, which should be retried"""
+    return not (isinstance(result, dict) and "error" in result)
@@ -0,0 +1,111 @@
+"""A manifest of plugins, to register them without importing their modules.
+
+the manifest records names, schemas and meta data of plugins, with a digest of
+every tool module. while the digests match, a plugin module is imported only
+when its function is first used.
+
+    python -m glados.tool._manifest  # rebuild the manifest
+"""
+
+import os
+import glob
+import json
+import hashlib
+import importlib
+import tempfile
+from typing import Optional
+
+PACKAGE = __spec__.parent  # not __name__, which is "__main__" with `python -m`
+PACKAGE_DIR = os.path.dirname(os.path.realpath(__file__))
+MANIFEST_PATH = os.path.join(PACKAGE_DIR, "_manifest.json")
+# set 0 to import all tool modules on start, like before
+USE_MANIFEST = os.environ.get("GLADOS_TOOL_MANIFEST", "1") == "1"
+
+
+def tool_modules() -> dict[str, str]:
+    """Get paths of tool modules by module name. names starting with '_' are not tools."""
+    modules = {}
+    for py_file in sorted(glob.glob(os.path.join(PACKAGE_DIR, "*.py"))):
+        module_name = os.path.splitext(os.path.basename(py_file))[0]
+        if not module_name.startswith("_"):
+            modules[f"{PACKAGE}.{module_name}"] = py_file
+    return modules
+
+
+def digest_modules() -> dict[str, str]:
+    digests = {}
+    for module, path in tool_modules().items():
+        with open(path, "rb") as f:
+            digests[module] = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    return digests
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Optional[dict]:
+    """Read the manifest, or None if it is missing or any tool module is changed."""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("modules") != digest_modules():
+        return None
+    return manifest
+
+
+def build_manifest(registry: dict) -> dict:
+    """Make a manifest of plugins registered by tool modules."""
+    modules = tool_modules()
+    return {
+        "modules": digest_modules(),
+        "plugins": {
+            tool_name: {
+                "module": tool["function"].__module__,
+                "meta": tool["meta"],
+                "schema": tool["schema"],
+            }
+            for tool_name, tool in registry.items()
+            if tool["function"].__module__ in modules
+        },
+    }
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_PATH):
+    """Write the manifest, replacing it atomically."""
+    directory = os.path.dirname(path)
+    with tempfile.NamedTemporaryFile(
+        "w", dir=directory, suffix=".json", delete=False, encoding="utf-8"
+    ) as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False, sort_keys=True)
+        f.write("\n")
+    os.replace(f.name, path)
+
+
+class LazyEntry(dict):
+    """A registry entry whose "function" imports the plugin module on first access."""
+
+    def __init__(self, registry: dict, tool_name: str, module: str, **entry):
+        super().__init__(**entry)
+        self.registry = registry
+        self.tool_name = tool_name
+        self.module = module
+
+    def __missing__(self, key):
+        if key != "function":
+            raise KeyError(key)
+        # the module registers the plugin again, replacing this entry
+        importlib.import_module(self.module)
+        entry = self.registry[self.tool_name]
+        if entry is self:
+            raise KeyError(f"{self.module} does not register {self.tool_name}")
+        function = entry["function"]
+        self["function"] = function
+        return function
+
+
+if __name__ == "__main__":
+    # register the plugins by importing their modules, not from the old manifest
+    os.environ["GLADOS_TOOL_MANIFEST"] = "0"
+    from glados.tool import __registry__
+
+    save_manifest(build_manifest(__registry__))
+    print(f"Wrote {len(__registry__)} plugins to {MANIFEST_PATH}")
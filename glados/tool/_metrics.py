@@ -0,0 +1,113 @@
+import os
+import random
+from typing import Optional
+
+# latency samples kept per tool to estimate percentiles
+RESERVOIR_SIZE = int(os.environ.get("GLADOS_TOOL_METRICS_SAMPLES", 1024))
+# upper bounds of latency histogram buckets in seconds, as prometheus counts them
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+
+def percentile(ordered: list[float], q: float) -> Optional[float]:
+    """the q-th quantile of sorted values, or None without any"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ToolStats:
+    """counters and latency samples of a tool"""
+
+    def __init__(self, reservoir_size: int = RESERVOIR_SIZE):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.latency_sum = 0.0
+        self.result_bytes = 0
+        self.max_result_bytes = 0
+        self.buckets = [0] * len(BUCKETS)
+        self.samples: list[float] = []
+        self.reservoir_size = reservoir_size
+
+    def record(self, latency: float, status: str, result_bytes: int):
+        self.calls += 1
+        self.errors += status == "error"
+        self.timeouts += status == "timeout"
+        self.latency_sum += latency
+        self.result_bytes += result_bytes
+        self.max_result_bytes = max(self.max_result_bytes, result_bytes)
+        for i, bound in enumerate(BUCKETS):
+            if latency <= bound:
+                self.buckets[i] += 1
+                break
+        # reservoir sampling keeps a uniform sample of all calls in bounded memory
+        if len(self.samples) < self.reservoir_size:
+            self.samples.append(latency)
+        else:
+            i = random.randrange(self.calls)
+            if i < self.reservoir_size:
+                self.samples[i] = latency
+
+    def to_dict(self) -> dict:
+        ordered = sorted(self.samples)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "latency_avg": self.latency_sum / self.calls if self.calls else None,
+            "latency_p50": percentile(ordered, 0.5),
+            "latency_p95": percentile(ordered, 0.95),
+            "latency_p99": percentile(ordered, 0.99),
+            "result_bytes_avg": self.result_bytes / self.calls if self.calls else None,
+            "result_bytes_max": self.max_result_bytes,
+        }
+
+
+class ToolMetrics:
+    """Calls, latencies, failures and result sizes of each tool."""
+
+    def __init__(self):
+        self.tools: dict[str, ToolStats] = {}
+
+    def record(self, tool_name: str, latency: float, status: str, result_bytes: int):
+        """Record a call. status is "ok", "error" or "timeout"."""
+        if tool_name not in self.tools:
+            self.tools[tool_name] = ToolStats()
+        self.tools[tool_name].record(latency, status, result_bytes)
+
+    def reset(self):
+        self.tools = {}
+
+    def to_dict(self) -> dict[str, dict]:
+        return {name: stats.to_dict() for name, stats in sorted(self.tools.items())}
+
+    def to_prometheus(self) -> str:
+        """Export in prometheus text format."""
+        tools = sorted(self.tools.items())
+        lines = []
+        for metric, attribute in (
+            ("glados_tool_calls_total", "calls"),
+            ("glados_tool_errors_total", "errors"),
+            ("glados_tool_timeouts_total", "timeouts"),
+            ("glados_tool_result_bytes_total", "result_bytes"),
+        ):
+            lines.append(f"# TYPE {metric} counter")
+            for name, stats in tools:
+                lines.append(f'{metric}{{tool="{name}"}} {getattr(stats, attribute)}')
+        lines.append("# TYPE glados_tool_latency_seconds histogram")
+        for name, stats in tools:
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stats.buckets):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(
+                    f'glados_tool_latency_seconds_bucket{{tool="{name}",le="{le}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(
+                f'glados_tool_latency_seconds_sum{{tool="{name}"}} {stats.latency_sum}'
+            )
+            lines.append(
+                f'glados_tool_latency_seconds_count{{tool="{name}"}} {stats.calls}'
+            )
+        return "\n".join(lines) + "\n"
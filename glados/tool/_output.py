@@ -0,0 +1,58 @@
+import os
+from typing import Optional
+from ..backend import tokenizer
+from ..session import Session
+
+# max tokens of a tool output kept in a session, unless the plugin sets max_tokens
+DEFAULT_MAX_TOKENS = int(os.environ.get("GLADOS_TOOL_MAX_TOKENS", 2000))
+
+
+def paginate(content: str, page_tokens: int, model: str = "gpt-4") -> list[str]:
+    """Split a text into pages of page_tokens tokens."""
+    encoding = tokenizer.get_encoding(model)
+    tokens = encoding.encode_ordinary(content)
+    return [
+        encoding.decode(tokens[start : start + page_tokens])
+        for start in range(0, max(1, len(tokens)), page_tokens)
+    ]
+
+
+def budget_output(
+    tool_name: str,
+    content: str,
+    max_tokens: int,
+    session: Optional[Session] = None,
+) -> str:
+    """Cut a tool output to max_tokens.
+
+    the whole output is kept in the session, and the model is told how to read
+    the rest with read_tool_output. without a session, the rest is dropped.
+    """
+    # a token has a byte at least, so short outputs need no encoding
+    if len(content.encode()) <= max_tokens:
+        return content
+    model = (session.model if session is not None else None) or "gpt-4"
+    pages = paginate(content, max_tokens, model)
+    if len(pages) == 1:
+        return content
+    if session is None:
+        return f"{pages[0]}\n\n[truncated: showing 1 of {len(pages)} pages]"
+    handle = session.spill(tool_name, content, page_tokens=max_tokens)
+    return (
+        f"{pages[0]}\n\n[truncated: showing page 1 of {len(pages)}. "
+        f'call read_tool_output with handle "{handle}" and page 2 to read more]'
+    )
+
+
+def read_page(session: Session, handle: str, page: int) -> str:
+    """Get a page of a tool output kept in the session."""
+    spill = session.spills.get(handle)
+    if spill is None:
+        raise KeyError(f"no tool output of handle {handle}, it may be expired")
+    page_tokens = spill.get("page_tokens", DEFAULT_MAX_TOKENS)
+    pages = paginate(spill["content"], page_tokens, session.model or "gpt-4")
+    if not 1 <= page <= len(pages):
+        raise IndexError(f"page should be between 1 and {len(pages)}")
+    if page == len(pages):
+        return f"{pages[page - 1]}\n\n[page {page} of {len(pages)}, the end]"
+    return f"{pages[page - 1]}\n\n[page {page} of {len(pages)}]"
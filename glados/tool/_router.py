@@ -0,0 +1,86 @@
+import os
+import hashlib
+from typing import Optional
+import numpy as np
+from openai import AsyncOpenAI
+from ..backend.client import use_openai
+from ..backend.vector import VectorIndex
+
+# "llm" asks a chat model for the tools of every message,
+# "embedding" compares the message with tool descriptions and asks only if unsure
+ROUTER_MODE = os.environ.get("GLADOS_TOOL_ROUTER", "llm")
+ROUTER_MODEL = os.environ.get("GLADOS_TOOL_ROUTER_MODEL", "text-embedding-3-small")
+# a tool scoring at least this is chosen
+SELECT_THRESHOLD = float(os.environ.get("GLADOS_TOOL_ROUTER_SELECT", 0.45))
+# a tool scoring below this is not. a score between the two is ambiguous
+REJECT_THRESHOLD = float(os.environ.get("GLADOS_TOOL_ROUTER_REJECT", 0.3))
+
+
+def describe_tool(tool_name: str, schema: dict) -> str:
+    """the text of a tool embedded for routing"""
+    return f"{tool_name}: {schema.get('description', tool_name)}"
+
+
+class ToolRouter:
+    """Chooses tools by cosine similarity of a message and tool descriptions.
+
+    descriptions are embedded once, and again only when they change. a message
+    costs one embedding request and a matrix-vector product.
+    """
+
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        *,
+        model: str = ROUTER_MODEL,
+        select: float = SELECT_THRESHOLD,
+        reject: float = REJECT_THRESHOLD,
+    ):
+        self.client = client
+        self.model = model
+        self.select = select
+        self.reject = reject
+        self.index = VectorIndex()
+        self.digests: dict[str, str] = {}  # tool name to digest of its description
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        client = self.client or use_openai()
+        response = await client.embeddings.create(input=texts, model=self.model)
+        return np.array([data.embedding for data in response.data], dtype=np.float32)
+
+    async def prepare(self, registry: dict):
+        """Embed the descriptions of tools added or changed since last time."""
+        for tool_name in set(self.digests) - set(registry):
+            self.index.remove(tool_name)
+            del self.digests[tool_name]
+        changed = {}
+        for tool_name, tool in registry.items():
+            text = describe_tool(tool_name, tool["schema"])
+            digest = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+            if self.digests.get(tool_name) != digest:
+                changed[tool_name] = (text, digest)
+        if not changed:
+            return
+        vectors = await self.embed([text for text, _ in changed.values()])
+        for (tool_name, (_, digest)), vector in zip(changed.items(), vectors):
+            self.index.upsert(tool_name, vector)
+            self.digests[tool_name] = digest
+
+    async def score(self, message: str) -> dict[str, float]:
+        """Get the similarity of a message to each tool."""
+        if len(self.index) == 0:
+            return {}
+        [vector] = await self.embed([message])
+        scores = self.index.vectors @ VectorIndex._normalize(vector)
+        return dict(zip(self.index.ids, scores.tolist()))
+
+    def decide(self, scores: dict[str, float]) -> Optional[list[str]]:
+        """Choose tools by scores, or None if any of them is ambiguous."""
+        if any(self.reject <= score < self.select for score in scores.values()):
+            return None
+        return [name for name, score in scores.items() if score >= self.select]
+
+    async def route(self, message: str, registry: dict) -> Optional[list[str]]:
+        """Choose tool names for a message, or None to ask a model instead."""
+        await self.prepare(registry)
+        return self.decide(await self.score(message))
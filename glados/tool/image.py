@@ -2,9 +2,9 @@ from typing import Annotated, Optional, TypedDict
 from enum import Enum
 from io import BytesIO
 from base64 import b64decode
-from openai import AsyncOpenAI
 from glados.util import make_public_url
 from glados.session import Session
+from glados.backend.client import use_openai
 from glados.tool import plugin
 
 __all__ = (
@@ -22,7 +22,7 @@ async def process_image(
 ) -> dict:
     """Let AI to process an image with a prompt using Vision API."""
     print(f"process_image {image_url=} {prompt=}")
-    client = AsyncOpenAI()
+    client = use_openai()
     s = Session(
         model="gpt-4-turbo",
         system_prompt=(
@@ -69,7 +69,7 @@ async def draw_image(
     ] = "natural",
 ) -> TypedDict("ImageResult", {"url": str}):
     """Draw an image with a prompt."""
-    client = AsyncOpenAI()
+    client = use_openai()
     ret = await client.images.generate(
         model="dall-e-3", prompt=prompt, style=style, response_format="b64_json"
     )
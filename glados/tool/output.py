@@ -0,0 +1,12 @@
+from typing import Annotated
+from glados.tool import context, plugin
+from glados.tool._output import read_page
+
+
+@plugin(name="Tool Output", icon="📜", max_tokens=0)
+async def read_tool_output(
+    handle: Annotated[str, "The handle of the truncated tool output."],
+    page: Annotated[int, "The page to read, starting from 1."] = 2,
+) -> str:
+    """read a page of a tool output which was too long and truncated"""
+    return read_page(context.get(), handle, page)
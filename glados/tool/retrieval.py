@@ -2,10 +2,10 @@ import os
 from typing import Annotated, Optional, Generator
 from bson import ObjectId
 from datetime import datetime, timezone
-from openai import AsyncOpenAI
 
 # from openparse import processing, DocumentParser, Node
 from glados.backend.db import use_db
+from glados.backend.client import use_openai
 from glados.tool import plugin
 from glados.session import SessionManager
 
@@ -67,7 +67,7 @@ async def save_document(
 
     file_id = r.inserted_id
 
-    openai = AsyncOpenAI()
+    openai = use_openai()
 
     for node in split_documents(file):
         print(f"{node.text=}")
@@ -131,7 +131,7 @@ async def search_document(
     limit: Annotated[Optional[int], "The maximum number of results to return."] = 3,
 ) -> Annotated[list[str], "The list of file contents that match the query."]:
     """Search the content of files."""
-    openai = AsyncOpenAI()
+    openai = use_openai()
     embeddings = await openai.embeddings.create(
         input=query, model="text-embedding-ada-002"
     )
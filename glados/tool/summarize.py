@@ -2,14 +2,12 @@ import os
 import tempfile
 from typing import Annotated, Optional
 from textwrap import dedent
-from openai import AsyncOpenAI
 import httpx
 import trafilatura
 from glados.session import SessionManager
+from glados.backend.client import use_openai
 from glados.tool import plugin
 
-openai = AsyncOpenAI()
-
 
 async def get_text_content(file_id: str) -> str:
     """
@@ -24,7 +22,7 @@ async def get_text_content(file_id: str) -> str:
     Raises:
         ValueError: If the file format is not supported.
     """
-    file_info = await openai.files.retrieve(file_id)
+    file_info = await use_openai().files.retrieve(file_id)
     filename, ext = os.path.splitext(file_info.filename)
     if ext not in (".pdf", ".txt", ".md"):
         raise ValueError("Unsupported file format.")
@@ -33,7 +31,7 @@ async def get_text_content(file_id: str) -> str:
     # parser = DocumentParser()
     parser = None
 
-    file_content = await openai.files.retrieve_content(file_id)
+    file_content = await use_openai().files.retrieve_content(file_id)
 
     if ext in (".txt", ".md"):
         return file_content
@@ -69,7 +67,7 @@ async def summarize(text: str, *, instructions: Optional[str] = None) -> str:
             During the summary, you should follow the instructions of the following instructions.
             Instructions: {instructions}""")
 
-    response = await openai.chat.completions.create(
+    response = await use_openai().chat.completions.create(
         model="gpt-4o-mini",
         max_tokens=2000,
         messages=[
@@ -96,7 +94,7 @@ async def summarize_recent_file(
     session = SessionManager.current
     thread_id = session.thread_id
 
-    messages = await openai.beta.threads.messages.list(
+    messages = await use_openai().beta.threads.messages.list(
         thread_id=thread_id, order="desc", limit=5
     )
 
@@ -119,7 +117,7 @@ async def summarize_recent_file(
     return {"summary": summary}
 
 
-@plugin(name="Summarize", icon="🌍")
+@plugin(name="Summarize", icon="🌍", cache_ttl=3600, cache_scope="global")
 async def summarize_url(
     url: Annotated[str, "The URL to summarize."],
     instructions: Annotated[
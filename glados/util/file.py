@@ -1,9 +1,9 @@
 import mimetypes
 
 from typing import Iterable, Optional
-from openai import AsyncOpenAI
 from openai.types.beta.threads.message_create_params import Attachment
 from openai._types import FileTypes, NotGiven, NOT_GIVEN  # XXX: interal import
+from ..backend.client import use_openai
 
 RUNNABLE_FILE_TYPES = [
     "text/x-c",
@@ -78,7 +78,7 @@ async def upload_files(
     if not files:
         return NOT_GIVEN
 
-    openai = AsyncOpenAI()
+    openai = use_openai()
     attachments = []
     for file_ in files:
         uploaded = await openai.files.create(
@@ -1,6 +1,5 @@
 from typing import IO
 import json
-import tiktoken
 import os
 
 from langchain.chat_models import ChatOpenAI
@@ -24,12 +23,7 @@ from langchain.text_splitter import (
 
 from trafilatura import extract as extract_html, fetch_url
 
-
-def count_tokens(text: str, model: str = "gpt-4") -> int:
-    """Count the number of tokens in a text."""
-    encoder = tiktoken.encoding_for_model(model)
-    tokens = encoder.encode(text)
-    return len(tokens)
+from ..backend.tokenizer import count_tokens, get_encoding
 
 
 def load_documents(file_path: os.PathLike | str, split=False) -> list[Document]:
@@ -81,13 +75,16 @@ def split_text(
     chunk_size=2000,
     chunk_overlap=100,
     headers_to_split_on=[("#", "Header 1"), ("##", "Header 2")],
+    model: str = "gpt-4",
 ) -> list[Document]:
     """Split a text into a list of documents."""
     splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
     md_docs = splitter.split_text(text)
 
     token_splitter = TokenTextSplitter(
-        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        encoding_name=get_encoding(model).name,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
     )
     return token_splitter.split_documents(md_docs)
 
@@ -97,10 +94,13 @@ def split_documents(
     chunk_size=2000,
     chunk_overlap=100,
     headers_to_split_on=[("#", "Header 1"), ("##", "Header 2")],
+    model: str = "gpt-4",
 ) -> list[Document]:
     """Split a list of documents into a list of documents."""
     doc_texts = "\n".join([doc.page_content for doc in docs])
-    splitted = split_text(doc_texts, chunk_size, chunk_overlap, headers_to_split_on)
+    splitted = split_text(
+        doc_texts, chunk_size, chunk_overlap, headers_to_split_on, model=model
+    )
     return splitted
 
 
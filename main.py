@@ -1,5 +1,7 @@
 import os
 import asyncio
+import signal
+import logging
 from argparse import ArgumentParser
 from dotenv import load_dotenv
 
@@ -7,12 +9,55 @@ load_dotenv()
 
 from slack_bolt.adapter.socket_mode.websockets import AsyncSocketModeHandler  # noqa: E402
 from glados.client.slack.bot import app  # noqa: E402
+from glados.session import SessionManager  # noqa: E402
+from glados.backend.shard import ShardRouter  # noqa: E402
+from glados.backend import executor  # noqa: E402
+from glados.backend.client import use_openai, close_openai  # noqa: E402
+
+
+async def setup_sessions():
+    """set up the session manager of this process"""
+    if os.environ.get("SESSION_CONDENSE") == "1":
+        # summarize long sessions in background instead of dropping old messages
+        SessionManager.condenser = use_openai()
+    if os.environ.get("SESSION_RESUME") == "1":
+        # embed sessions to find a similar past session to resume
+        SessionManager.embedder = use_openai()
+        SessionManager.load_vectors()
+    try:
+        # know which threads belong to the bot without querying every message
+        await SessionManager.load_index()
+    except Exception as exc:
+        logging.error("Error while loading session index", exc_info=exc)
 
 
 async def run_slackbot():
     """run slackbot"""
     handler = AsyncSocketModeHandler(app, os.environ["SLACK_APP_TOKEN"])
-    await handler.start_async()
+    await setup_sessions()
+    try:
+        await handler.start_async()
+    finally:
+        # write sessions not persisted yet
+        await SessionManager.close()
+        executor.shutdown()
+        await close_openai()
+
+
+async def run_sharded_slackbot(num_shards: int):
+    """run slackbot in worker processes, each owning a part of the sessions"""
+    router = ShardRouter(num_shards, setup=setup_sessions)
+    await router.start()
+    loop = asyncio.get_running_loop()
+    # SIGUSR1 adds a worker, SIGUSR2 removes one
+    for sig, delta in ((signal.SIGUSR1, 1), (signal.SIGUSR2, -1)):
+        loop.add_signal_handler(
+            sig, lambda delta=delta: asyncio.ensure_future(router.scale(delta))
+        )
+    try:
+        await router.serve(os.environ["SLACK_APP_TOKEN"])
+    finally:
+        await router.close()
 
 
 if __name__ == "__main__":
@@ -20,7 +65,16 @@ if __name__ == "__main__":
     parser.add_argument(
         "--client", required=True, choices=["slack"], help="client to run"
     )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=int(os.environ.get("GLADOS_SHARDS", 1)),
+        help="number of worker processes",
+    )
     args = parser.parse_args()
     client = args.client
     if client == "slack":
-        asyncio.run(run_slackbot())
+        if args.shards > 1:
+            asyncio.run(run_sharded_slackbot(args.shards))
+        else:
+            asyncio.run(run_slackbot())
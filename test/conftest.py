@@ -1,5 +1,245 @@
 import os
 import sys
+import asyncio
+from types import SimpleNamespace
+from typing import Optional
+import pytest
 
 # add to system path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+@pytest.fixture
+def plugin():
+    """glados.tool.plugin, unregistering the plugins of the test afterwards"""
+    import glados.tool
+
+    registered = set(glados.tool.__registry__)
+    yield glados.tool.plugin
+    added = set(glados.tool.__registry__) - registered
+    for tool_name in added:
+        del glados.tool.__registry__[tool_name]
+    if added:
+        glados.tool.registry_version += 1
+
+
+@pytest.fixture
+def tool_call():
+    """make a tool call of a chat completion chunk"""
+    from openai.types.chat.chat_completion_chunk import (
+        ChoiceDeltaToolCall,
+        ChoiceDeltaToolCallFunction,
+    )
+
+    def make(index, name, arguments="{}"):
+        return ChoiceDeltaToolCall(
+            index=index,
+            id=f"call_{index}",
+            type="function",
+            function=ChoiceDeltaToolCallFunction(name=name, arguments=arguments),
+        )
+
+    return make
+
+
+class FakeCollection:
+    """In-memory stand-in of a motor collection supporting the used operations."""
+
+    def __init__(self):
+        self.documents: list[dict] = []
+        self.calls: list[str] = []
+        self.latency = 0  # seconds to wait on each read
+
+    def _match(self, document: dict, filter: dict) -> bool:
+        for key, value in filter.items():
+            if isinstance(value, dict) and "$ne" in value:
+                if document.get(key) == value["$ne"]:
+                    return False
+            elif isinstance(value, dict) and "$gt" in value:
+                if key not in document or not document[key] > value["$gt"]:
+                    return False
+            elif document.get(key) != value:
+                return False
+        return True
+
+    async def find_one(self, filter: dict):
+        self.calls.append("find_one")
+        await asyncio.sleep(self.latency)
+        for document in self.documents:
+            if self._match(document, filter):
+                return dict(document)
+        return None
+
+    async def insert_one(self, document: dict):
+        self.calls.append("insert_one")
+        self.documents.append({"_id": len(self.documents), **document})
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False):
+        self.calls.append("update_one")
+        self._update(filter, update, upsert)
+
+    async def bulk_write(self, operations: list, ordered: bool = True):
+        self.calls.append("bulk_write")
+        for op in operations:
+            self._update(op._filter, op._doc, op._upsert)
+
+    def _update(self, filter: dict, update: dict, upsert: bool):
+        for document in self.documents:
+            if self._match(document, filter):
+                break
+        else:
+            if not upsert:
+                return
+            document = {"_id": len(self.documents), **filter}
+            self.documents.append(document)
+        document.update(update.get("$set", {}))
+        for key in update.get("$unset", {}):
+            document.pop(key, None)
+        for key, push in update.get("$push", {}).items():
+            values = document.get(key, []) + list(push["$each"])
+            if "$slice" in push:
+                values = values[push["$slice"] :]
+            document[key] = values
+
+    async def find(self, filter: dict, projection: Optional[dict] = None):
+        self.calls.append("find")
+        for document in self.documents:
+            if self._match(document, filter):
+                if projection:
+                    document = {
+                        k: v for k, v in document.items() if projection.get(k)
+                    }
+                yield dict(document)
+
+    async def delete_many(self, filter: dict):
+        self.calls.append("delete_many")
+        self.documents = [d for d in self.documents if not self._match(d, filter)]
+
+    async def create_index(self, keys, **kwargs):
+        self.calls.append("create_index")
+
+    async def count_documents(self, filter: dict) -> int:
+        self.calls.append("count_documents")
+        return sum(1 for document in self.documents if self._match(document, filter))
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections: dict[str, FakeCollection] = {}
+
+    def get_collection(self, name: str) -> FakeCollection:
+        return self.collections.setdefault(name, FakeCollection())
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Replace the database of sessions with an in-memory one."""
+    db = FakeDatabase()
+    monkeypatch.setattr("glados.session.use_db", lambda: db)
+    monkeypatch.setattr("glados.backend.persistent.use_db", lambda: db)
+    monkeypatch.setattr("glados.backend.migrate.use_db", lambda: db)
+    monkeypatch.setattr("glados.tool._cache.use_db", lambda: db)
+    return db
+
+
+@pytest.fixture
+def slow_writes(fake_db):
+    """make writes of sessions take a while, and get an event set when one starts"""
+    col = fake_db.get_collection("sessions")
+    bulk_write = col.bulk_write
+    started = asyncio.Event()
+
+    async def slow_bulk_write(operations, ordered=True):
+        started.set()
+        await asyncio.sleep(0.05)
+        await bulk_write(operations, ordered)
+
+    col.bulk_write = slow_bulk_write
+    return col, started
+
+
+@pytest.fixture
+def session_manager(fake_db, monkeypatch, tmp_path):
+    """SessionManager with empty memory and a writer flushing on demand only"""
+    from glados.backend.cache import LRUCache, TTLCache
+    from glados.backend.persistent import WriteBehind
+    from glados.backend.vector import VectorIndex
+    from glados.session import (
+        SessionManager,
+        make_session_update,
+        rollback_session_update,
+    )
+
+    monkeypatch.setattr(
+        "glados.session.SESSION_INDEX_PATH", str(tmp_path / "index.npz")
+    )
+    monkeypatch.setattr(SessionManager, "sessions", LRUCache(2))
+    monkeypatch.setattr(
+        SessionManager,
+        "writer",
+        WriteBehind(
+            "sessions",
+            make_session_update,
+            rollback=rollback_session_update,
+            interval=3600,
+            batch_size=100,
+        ),
+    )
+    monkeypatch.setattr(SessionManager, "known", set())
+    monkeypatch.setattr(SessionManager, "indexed", False)
+    monkeypatch.setattr(SessionManager, "trust_index", True)
+    monkeypatch.setattr(SessionManager, "missing", TTLCache(100, ttl=30))
+    monkeypatch.setattr(SessionManager, "index", VectorIndex())
+    monkeypatch.setattr(SessionManager, "indexed_subjects", {})
+    yield SessionManager
+    SessionManager.writer.pending.clear()
+
+
+class FakeEncoding:
+    """encodes one token per character to keep tests offline"""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode_ordinary(self, text: str) -> list[int]:
+        self.calls.append(text)
+        return list(text)
+
+    def encode_ordinary_batch(self, texts: list[str], num_threads=8):
+        return [self.encode_ordinary(text) for text in texts]
+
+    def decode(self, tokens: list[str]) -> str:
+        return "".join(tokens)
+
+
+@pytest.fixture
+def fake_tokenizer(monkeypatch):
+    """Count tokens without downloading encodings"""
+    encoding = FakeEncoding()
+    monkeypatch.setattr(
+        "glados.backend.tokenizer.get_encoding", lambda model: encoding
+    )
+    return encoding.calls
+
+
+class StubEmbedder:
+    """embeds a text by counting the keywords in it"""
+
+    def __init__(self, keywords: list[str]):
+        self.keywords = keywords
+        self.embeddings = self
+        self.requests = []
+
+    async def create(self, input: list[str], model: str):
+        self.requests.append(input)
+        data = [
+            SimpleNamespace(embedding=[text.count(k) for k in self.keywords])
+            for text in input
+        ]
+        return SimpleNamespace(data=data)
+
+
+@pytest.fixture
+def embedder():
+    """make an embedding client counting the given keywords"""
+    return StubEmbedder
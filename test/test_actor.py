@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from glados.backend.actor import Actors
+
+
+@pytest.mark.asyncio
+async def test_jobs_of_a_key_run_in_order():
+    actors = Actors()
+    log = []
+
+    def job(key, i):
+        async def run():
+            log.append((key, i, "start"))
+            await asyncio.sleep(0.01)
+            log.append((key, i, "end"))
+            return i
+
+        return run
+
+    results = await asyncio.gather(
+        *[actors.run(key, job(key, i)) for i in range(3) for key in "ab"]
+    )
+    assert results == [0, 0, 1, 1, 2, 2]
+    for key in "ab":
+        assert [entry[1:] for entry in log if entry[0] == key] == [
+            (i, step) for i in range(3) for step in ("start", "end")
+        ]
+    # different keys run concurrently
+    assert log[:2] == [("a", 0, "start"), ("b", 0, "start")]
+    await actors.close()
+
+
+@pytest.mark.asyncio
+async def test_queue_depth_and_errors():
+    actors = Actors()
+    release = asyncio.Event()
+
+    async def wait():
+        await release.wait()
+
+    async def fail():
+        raise ValueError("boom")
+
+    waiting = asyncio.gather(
+        actors.run("a", wait), actors.run("a", fail), return_exceptions=True
+    )
+    await asyncio.sleep(0)
+    assert actors.depth("a") == 2
+    assert actors.depth("b") == 0
+    release.set()
+    first, second = await waiting
+    assert first is None
+    assert isinstance(second, ValueError)
+    assert actors.depth("a") == 0
+    await actors.close()
+
+
+@pytest.mark.asyncio
+async def test_idle_actors_are_reaped():
+    actors = Actors(idle_timeout=0.01)
+
+    async def job():
+        return "done"
+
+    assert await actors.run("a", job) == "done"
+    assert "a" in actors.actors
+    await asyncio.sleep(0.05)
+    assert actors.actors == {}
+    assert await actors.run("a", job) == "done"
+    await actors.close()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_job_does_not_stop_actor():
+    actors = Actors()
+    release = asyncio.Event()
+
+    async def wait():
+        await release.wait()
+
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    async def job():
+        return "done"
+
+    waiting = [actors.run("a", job) for job in (wait, cancelled, job)]
+    results = asyncio.gather(*waiting, return_exceptions=True)
+    await asyncio.sleep(0)
+    release.set()
+    first, second, third = await asyncio.wait_for(results, 1)
+    assert isinstance(second, asyncio.CancelledError)
+    assert third == "done"
+
+    # jobs left when the actor stops are cancelled, not waited forever
+    release.clear()
+    waiting = [actors.run("a", wait), actors.run("a", job)]
+    results = asyncio.gather(*waiting, return_exceptions=True)
+    await asyncio.sleep(0)
+    await actors.close()
+    assert all(
+        isinstance(result, asyncio.CancelledError)
+        for result in await asyncio.wait_for(results, 1)
+    )
@@ -0,0 +1,178 @@
+import json
+import asyncio
+from types import SimpleNamespace
+import httpx
+import pytest
+from openai import AsyncOpenAI
+from glados.assistant import GLaDOS, GLaDOSv1, AssistantResponse
+from glados.session import Session, SessionManager
+from glados.tool import format_tools
+
+pytestmark = pytest.mark.usefixtures("fake_tokenizer")
+
+
+def sse(deltas: list[dict], finish_reason: str) -> bytes:
+    """a streamed chat completion of the deltas"""
+    chunks = [
+        {
+            "id": "chatcmpl-1",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "gpt-4o",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+        }
+        for delta in deltas
+    ]
+    chunks[-1]["choices"][0]["finish_reason"] = finish_reason
+    events = [f"data: {json.dumps(chunk)}\n\n" for chunk in chunks]
+    return ("".join(events) + "data: [DONE]\n\n").encode()
+
+
+def tool_call_deltas(name: str, arguments: str) -> list[dict]:
+    first = {"index": 0, "id": "call_1", "type": "function"}
+    first["function"] = {"name": name, "arguments": ""}
+    deltas = [{"tool_calls": [first]}]
+    for i in range(0, len(arguments), 3):
+        fragment = {"index": 0, "function": {"arguments": arguments[i : i + 3]}}
+        deltas.append({"tool_calls": [fragment]})
+    return deltas
+
+
+class StubCompletions:
+    """answers chat completions with tool calls until a round limit, then text"""
+
+    def __init__(self, tool_rounds: int):
+        self.tool_rounds = tool_rounds
+        self.requests: list[dict] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body)
+        if len(self.requests) <= self.tool_rounds and body.get("tool_choice") != "none":
+            content = sse(tool_call_deltas("shout", '{"text": "hello"}'), "tool_calls")
+        else:
+            content = sse([{"content": "Hel"}, {"content": "lo!"}], "stop")
+        return httpx.Response(
+            200, content=content, headers={"content-type": "text/event-stream"}
+        )
+
+
+@pytest.fixture
+def assistant(monkeypatch, plugin):
+    @plugin
+    async def shout(text: str):
+        return text.upper()
+
+    async def choose_tools(message):
+        return format_tools(["shout"])
+
+    monkeypatch.setattr("glados.assistant.choose_tools", choose_tools)
+
+    def make(tool_rounds: int, max_tool_rounds: int):
+        completions = StubCompletions(tool_rounds)
+        glados = GLaDOSv1(max_tool_rounds=max_tool_rounds)
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(completions))
+        glados.client = AsyncOpenAI(api_key="x", http_client=http_client)
+        return glados, completions
+
+    return make
+
+
+@pytest.mark.asyncio
+async def test_chat_with_tools(assistant):
+    glados, completions = assistant(tool_rounds=1, max_tool_rounds=3)
+    answers = [answer async for answer in glados.chat("say hello loudly")]
+    assert answers == [
+        AssistantResponse(event="function_calling", content="shout"),
+        "Hel",
+        "lo!",
+    ]
+    messages = completions.requests[-1]["messages"]
+    assert messages[-2]["tool_calls"][0]["function"] == {
+        "name": "shout",
+        "arguments": '{"text": "hello"}',
+    }
+    assert messages[-1] == {
+        "role": "tool",
+        "tool_call_id": "call_1",
+        "name": "shout",
+        "content": '"HELLO"',
+    }
+
+
+@pytest.mark.asyncio
+async def test_chat_tool_rounds_limited(assistant):
+    glados, completions = assistant(tool_rounds=10, max_tool_rounds=2)
+    answers = [answer async for answer in glados.chat("say hello loudly")]
+    assert answers[-2:] == ["Hel", "lo!"]
+    assert len(completions.requests) == 3
+    assert completions.requests[-1]["tool_choice"] == "none"
+
+
+class StubThreads:
+    """beta threads api taking a while for each request"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.messages = self
+        self.runs = self
+        self.created: list[dict] = []
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        self.created.append(kwargs)
+        return SimpleNamespace(id="thread_1")
+
+    def create_and_stream(self, **kwargs):
+        self.created.append(kwargs)
+        return StubRun()
+
+
+class StubRun:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def until_done(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_glados_setup_pipelined(monkeypatch):
+    session = Session("1", model="gpt-4o")
+
+    async def get_session(session_id):
+        await asyncio.sleep(0.05)
+        return session
+
+    async def save_session(session_id):
+        assert session.thread_id == "thread_1"
+
+    async def choose_tools(message):
+        await asyncio.sleep(0.2)
+        return format_tools(["get_date"])
+
+    monkeypatch.setattr(SessionManager, "get_session", get_session)
+    monkeypatch.setattr(SessionManager, "save_session", save_session)
+    monkeypatch.setattr("glados.assistant.choose_tools", choose_tools)
+    glados = GLaDOS()
+    threads = StubThreads(delay=0.05)
+    glados.client = SimpleNamespace(beta=SimpleNamespace(threads=threads))
+
+    timings = await glados.chat("what date is it", handler=None, session_id="1")
+    # thread, message and session are done while choosing tools
+    assert timings["total"] < 0.25
+    assert timings["saved"] > 0.1
+    thread, message, run = threads.created
+    assert message["content"] == "what date is it"
+    assert [tool["type"] for tool in run["tools"]] == [
+        "code_interpreter",
+        "file_search",
+        "function",
+        "function",
+    ]
+    # outputs of the tools can be read by pages in the run
+    assert run["tools"][-1]["function"]["name"] == "read_tool_output"
+    assert session[-1] == {"role": "user", "content": "what date is it"}
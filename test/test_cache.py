@@ -0,0 +1,56 @@
+from glados.backend.cache import LRUCache, TTLCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache["a"] = 1
+    cache["b"] = 2
+    cache["c"] = 3
+    assert cache.get("a") == 1  # "b" is the least recently used now
+    assert cache.evict() == [("b", 2)]
+    assert list(cache) == ["c", "a"]
+    assert cache.stats() == {
+        "size": 2,
+        "weight": 0,
+        "hits": 1,
+        "misses": 0,
+        "evictions": 1,
+    }
+
+
+def test_lru_evicts_by_weight():
+    cache = LRUCache(maxweight=10, weigh=len)
+    cache["a"] = "x" * 4
+    cache["b"] = "x" * 4
+    assert cache.evict() == []
+    cache["c"] = "x" * 4
+    assert cache.evict() == [("a", "xxxx")]
+    assert cache.weight == 8
+
+    # the most recent item is kept even if it is too heavy by itself
+    cache["d"] = "x" * 20
+    assert [k for k, _ in cache.evict()] == ["b", "c"]
+    assert list(cache) == ["d"]
+
+
+def test_lru_counts_misses():
+    cache = LRUCache(2)
+    assert cache.get("a") is None
+    assert cache.peek("a") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_cache_expires_items():
+    now = [0.0]
+    cache = TTLCache(2, ttl=10, timer=lambda: now[0])
+    cache["a"] = 1
+    cache.set("b", 2, ttl=20)
+    now[0] = 15
+    assert "a" not in cache
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+    cache["c"] = 3
+    cache["d"] = 4  # over the capacity, "b" is dropped on insertion
+    assert list(cache) == ["c", "d"]
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,42 @@
+import httpx
+import pytest
+from openai import AsyncOpenAI
+from glados.backend import client
+from glados.backend.client import close_openai, set_openai, use_openai
+
+
+@pytest.fixture(autouse=True)
+def reset_client():
+    set_openai(None)
+    yield
+    set_openai(None)
+
+
+@pytest.mark.asyncio
+async def test_shared_client():
+    first = use_openai()
+    assert use_openai() is first
+    pool = first._client._transport._pool
+    assert pool._max_connections == client.MAX_CONNECTIONS
+    assert pool._max_keepalive_connections == client.MAX_KEEPALIVE_CONNECTIONS
+
+    await close_openai()
+    assert first.is_closed()
+    assert use_openai() is not first
+
+
+@pytest.mark.asyncio
+async def test_inject_client():
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request.url.path)
+        data = [{"object": "embedding", "index": 0, "embedding": [1.0]}]
+        return httpx.Response(200, json={"object": "list", "data": data, "model": "m"})
+
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    stub = AsyncOpenAI(api_key="x", http_client=http_client)
+    set_openai(stub)
+    assert use_openai() is stub
+    await use_openai().embeddings.create(input=["a"], model="m")
+    assert requests == ["/v1/embeddings"]
@@ -0,0 +1,433 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from glados.backend.persistent import WriteBehind
+from glados.backend.vector import VectorIndex
+from glados.session import (
+    Session,
+    SessionManager,
+    MAX_TOKENS,
+    CONDENSE_RATIO,
+    make_session_update,
+    rollback_session_update,
+)
+
+pytestmark = pytest.mark.usefixtures("fake_tokenizer")
+
+
+def test_append_counts_message_once(fake_tokenizer):
+    s = Session(model="gpt-3.5-turbo")
+    for i in range(10):
+        s(f"message {i}")
+    assert len(fake_tokenizer) == 10
+    assert len(s.token_counts) == len(s.messages)
+    assert s.total_tokens == sum(s.token_counts)
+
+
+def test_append_trims_oldest_messages():
+    s = Session(model="gpt-3.5-turbo")
+    for i in range(1000):
+        s(f"message {i}")
+    assert s.total_tokens <= MAX_TOKENS["gpt-3.5-turbo"]
+    assert s.total_tokens == sum(s.token_counts)
+    assert s.messages[-1]["content"] == "message 999"
+    assert s.messages[0]["content"] != "message 0"
+
+
+def test_snapshot_keeps_token_counts(fake_tokenizer):
+    s = Session("1234", model="gpt-3.5-turbo")
+    s("hello")
+    s("world", role="assistant")
+    snapshot = s.to_dict()
+    assert snapshot["token_counts"] == s.token_counts
+
+    fake_tokenizer.clear()
+    restored = Session.from_snapshot(snapshot)
+    assert fake_tokenizer == []
+    assert restored.token_counts == s.token_counts
+    assert restored.total_tokens == s.total_tokens
+
+    # snapshots from older versions have no token counts
+    del snapshot["token_counts"]
+    restored = Session.from_snapshot(snapshot)
+    assert len(fake_tokenizer) == 2
+    assert restored.total_tokens == s.total_tokens
+
+
+def test_recent_tokens_slice():
+    s = Session(model="gpt-3.5-turbo")
+    for i in range(100):
+        s(f"message {i:03}")
+    for budget in (0, 10, 100, 1000):
+        recent = s[budget:...]
+        assert recent[-1]["content"] == "message 099"
+        start = len(s.messages) - len(recent)
+        assert sum(s.token_counts[start:]) <= max(budget, s.token_counts[-1])
+        # one more message would exceed the budget
+        assert sum(s.token_counts[start - 1 :]) > budget
+    assert s[...] == s.messages
+    assert s[1:3] == s.messages[1:3]
+
+
+def test_recent_tokens_slice_keeps_tool_calls():
+    s = Session(model="gpt-3.5-turbo")
+    s("what time is it?")
+    s({"role": "assistant", "tool_calls": [{"id": "call_1", "type": "function"}]})
+    s({"role": "tool", "tool_call_id": "call_1", "content": "x" * 100})
+    s({"role": "tool", "tool_call_id": "call_2", "content": "y" * 10})
+    recent = s[50:...]
+    assert recent[0]["role"] == "assistant"
+    assert len(recent) == 3
+
+
+@pytest.mark.asyncio
+async def test_evicted_session_is_saved(fake_db, session_manager):
+    col = fake_db.get_collection("sessions")
+
+    first = await SessionManager.get_session("1")
+    first("hello")
+    await SessionManager.get_session("2")
+    await SessionManager.get_session("3")
+
+    assert "1" not in SessionManager.sessions
+    assert SessionManager.stats()["evictions"] == 1
+    # evicted but not written yet, still reachable
+    assert await SessionManager.get_session("1") is first
+    await SessionManager.get_session("2")
+    await SessionManager.get_session("3")
+
+    await SessionManager.close()
+    saved = await col.find_one({"session_id": "1"})
+    assert saved["messages"] == [{"role": "user", "content": "hello"}]
+
+    restored = await SessionManager.get_session("1")
+    assert restored.messages == first.messages
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_written_in_batch(fake_db, session_manager):
+    col = fake_db.get_collection("sessions")
+    for i in range(10):
+        session = await SessionManager.get_session(str(i))
+        session("hello")
+        await SessionManager.save_session(str(i))
+    assert col.calls.count("find_one") == 10
+    assert "insert_one" not in col.calls
+    assert "update_one" not in col.calls
+
+    await SessionManager.close()
+    assert col.calls.count("bulk_write") == 1
+    assert len(col.documents) == 10
+    assert SessionManager.stats()["writes"] == 10
+
+
+@pytest.mark.asyncio
+async def test_writer_flushes_when_full(fake_db):
+    col = fake_db.get_collection("sessions")
+    writer = WriteBehind("sessions", make_session_update, interval=3600, batch_size=3)
+    for i in range(3):
+        writer.mark(str(i), Session(str(i)))
+    await asyncio.sleep(0.01)
+    assert col.calls == ["bulk_write"]
+    assert writer.pending == {}
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_flush_waits_for_write_in_progress(slow_writes):
+    col, started = slow_writes
+    writer = WriteBehind("sessions", make_session_update, interval=3600, batch_size=1)
+    session = Session("1")
+    session("hello")
+    writer.mark("1", session)
+    await started.wait()
+    await writer.flush()
+    assert len(col.documents) == 1
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_close_finishes_write_in_progress(slow_writes):
+    col, started = slow_writes
+    writer = WriteBehind(
+        "sessions",
+        make_session_update,
+        rollback=rollback_session_update,
+        interval=3600,
+        batch_size=1,
+    )
+    session = Session("1")
+    session("hello")
+    writer.mark("1", session)
+    await started.wait()
+    await writer.close()
+    [snapshot] = col.documents
+    assert snapshot["messages"] == session.messages
+    assert writer.pending == {} and not session.dirty
+
+
+@pytest.mark.asyncio
+async def test_only_new_messages_are_written(fake_db, session_manager):
+    col = fake_db.get_collection("sessions")
+    session = await SessionManager.get_session("1", model="gpt-3.5-turbo")
+    for i in range(3):
+        session(f"message {i}")
+    await SessionManager.save_session("1")
+    await SessionManager.flush()
+
+    writes = []
+    bulk_write = col.bulk_write
+
+    async def record_writes(operations, ordered=True):
+        writes.extend(operation._doc for operation in operations)
+        await bulk_write(operations, ordered)
+
+    col.bulk_write = record_writes
+    session("message 3")
+    await SessionManager.save_session("1")
+    await SessionManager.flush()
+    [update] = writes
+    assert update["$push"] == {
+        "messages": {
+            "$each": [{"role": "user", "content": "message 3"}],
+            "$slice": -4,
+        },
+        "token_counts": {"$each": session.token_counts[-1:], "$slice": -4},
+    }
+    assert "messages" not in update["$set"]
+    saved = await col.find_one({"session_id": "1"})
+    assert saved["messages"] == session.messages
+
+    # trimmed messages are sliced off from the stored ones as well
+    for i in range(4, 1000):
+        session(f"message {i}")
+    await SessionManager.save_session("1")
+    await SessionManager.flush()
+    update = writes[-1]
+    num_messages = len(session.messages)
+    assert update["$push"]["messages"]["$slice"] == -num_messages
+    assert update["$push"]["token_counts"]["$slice"] == -num_messages
+    await SessionManager.close()
+    saved = await col.find_one({"session_id": "1"})
+    assert saved["messages"] == session.messages
+    assert saved["token_counts"] == session.token_counts
+
+
+@pytest.mark.asyncio
+async def test_failed_write_is_retried_entirely(fake_db, session_manager):
+    col = fake_db.get_collection("sessions")
+    session = await SessionManager.get_session("1")
+    session("hello")
+    await SessionManager.save_session("1")
+
+    async def bulk_write(operations, ordered=True):
+        raise ConnectionError()
+
+    col.bulk_write = bulk_write
+    with pytest.raises(ConnectionError):
+        await SessionManager.flush()
+    assert session.dirty and session.rewrite
+    assert SessionManager.writer.get("1") is session
+
+    del col.bulk_write
+    await SessionManager.close()
+    saved = await col.find_one({"session_id": "1"})
+    assert saved["messages"] == session.messages
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_are_coalesced(fake_db, session_manager):
+    col = fake_db.get_collection("sessions")
+    col.latency = 0.05
+    await col.insert_one(Session("old").to_dict())
+    col.calls.clear()
+
+    sessions = await asyncio.gather(
+        *[SessionManager.get_session(session_id) for session_id in ["old", "new"] * 50]
+    )
+    assert col.calls.count("find_one") == 2
+    assert len({id(s) for s in sessions[0::2]}) == 1
+    assert len({id(s) for s in sessions[1::2]}) == 1
+    assert SessionManager.loading == {}
+
+    await SessionManager.close()
+    assert sum(1 for d in col.documents if d["session_id"] == "new") == 1
+
+
+@pytest.mark.asyncio
+async def test_has_session_caches_misses(fake_db, session_manager):
+    col = fake_db.get_collection("sessions")
+    await col.insert_one(Session("bot-thread").to_dict())
+
+    assert await SessionManager.has_session("bot-thread")
+    assert await SessionManager.has_session("bot-thread")
+    assert not await SessionManager.has_session("other-thread")
+    assert not await SessionManager.has_session("other-thread")
+    assert col.calls.count("count_documents") == 2
+
+    # a new session is known at once
+    await SessionManager.get_session("other-thread")
+    assert await SessionManager.has_session("other-thread")
+    await SessionManager.close()
+
+
+@pytest.mark.asyncio
+async def test_has_session_uses_index(fake_db, session_manager):
+    col = fake_db.get_collection("sessions")
+    for i in range(3):
+        await col.insert_one(Session(str(i)).to_dict())
+    await SessionManager.load_index()
+    col.calls.clear()
+
+    assert await SessionManager.has_session("1")
+    assert not await SessionManager.has_session("not-a-session")
+    assert col.calls == []
+
+
+class StubModelClient:
+    """answers every chat completion with a fixed summary after a delay"""
+
+    def __init__(self, content: str, delay: float = 0):
+        self.content = content
+        self.delay = delay
+        self.requests = []
+        self.chat = self
+        self.completions = self
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        await asyncio.sleep(self.delay)
+        message = SimpleNamespace(content=self.content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.mark.asyncio
+async def test_condense_replaces_old_messages():
+    s = Session(model="gpt-3.5-turbo")
+    for i in range(100):
+        s(f"message {i:03}")
+    oldest = s.messages[0]["content"]
+    client = StubModelClient("summary")
+    await s.condense(client)
+
+    assert oldest in client.requests[0]["messages"][1]["content"]
+    assert s.summary == "summary"
+    assert s.messages[1] == {"role": "assistant", "content": "summary"}
+    assert s.messages[-1]["content"] == "message 099"
+    assert s.total_tokens <= s.max_tokens // 2 + sum(s.token_counts[:2])
+    assert s.total_tokens == sum(s.token_counts)
+    assert s.rewrite
+
+
+@pytest.mark.asyncio
+async def test_condensed_session_written(session_manager, fake_db, fake_tokenizer):
+    s = await SessionManager.get_session("c1", model="gpt-3.5-turbo")
+    for i in range(100):
+        s(f"message {i:03}")
+    await SessionManager.save_session("c1")
+    await SessionManager.flush()
+
+    client = StubModelClient("summary")
+    await s.condense(client)
+    assert client.requests[0]["max_tokens"] == int(s.max_tokens * (1 - CONDENSE_RATIO))
+    await SessionManager.flush()
+    [snapshot] = fake_db.get_collection("sessions").documents
+    assert snapshot["summary"] == "summary"
+    assert snapshot["messages"][1]["content"] == "summary"
+    assert len(snapshot["messages"]) == len(s.messages)
+    await SessionManager.writer.close()
+
+
+@pytest.mark.asyncio
+async def test_condense_in_background():
+    s = Session(model="gpt-3.5-turbo")
+    s.condenser = StubModelClient("summary", delay=0.01)
+    i = 0
+    while s._condensing is None:
+        s(f"message {i:03}")
+        i += 1
+    assert s.total_tokens >= s.max_tokens * 0.8
+    condensing = s._condensing
+
+    # the conversation goes on while condensing
+    s("new message")
+    assert s._condensing is condensing
+    await condensing
+
+    assert s._condensing is None
+    assert len(s.condenser.requests) == 1
+    assert s.messages[1]["content"] == "summary"
+    assert s.messages[-1]["content"] == "new message"
+    assert s.total_tokens < s.max_tokens * 0.8
+
+
+# words of the subjects counted by the stub embedder
+KEYWORDS = ["pizza", "python", "weather"]
+
+
+@pytest.mark.asyncio
+async def test_resume_similar_session(session_manager, embedder, monkeypatch):
+    monkeypatch.setattr(SessionManager, "embedder", embedder(KEYWORDS))
+    for session_id, subject in [("1", "best pizza in town"), ("2", "python typing")]:
+        session = await SessionManager.get_session(session_id, model="gpt-3.5-turbo")
+        session(subject)
+        session("sure", role="assistant")
+        await SessionManager.save_session(session_id)
+    await asyncio.gather(*SessionManager.tasks)
+    assert len(SessionManager.index) == 2
+
+    # subject is not changed, no need to embed again
+    await SessionManager.save_session("1")
+    assert len(SessionManager.embedder.requests) == 2
+
+    resumed = await SessionManager.resume_session("3", "how to write python")
+    assert [m["content"] for m in resumed.messages] == ["python typing", "sure"]
+
+    unrelated = await SessionManager.resume_session("4", "what's the weather")
+    assert unrelated.messages == []
+
+    await SessionManager.close()
+    SessionManager.load_vectors()
+    assert len(SessionManager.index) == 2
+
+
+@pytest.mark.asyncio
+async def test_resume_session_of_same_user(session_manager, embedder, monkeypatch):
+    monkeypatch.setattr(SessionManager, "embedder", embedder(KEYWORDS))
+    for session_id, user, subject in [
+        ("1", "alice", "python packaging"),
+        ("2", "bob", "python typing"),
+    ]:
+        session = await SessionManager.get_session(session_id, user=user)
+        session(subject)
+        await SessionManager.save_session(session_id)
+    await asyncio.gather(*SessionManager.tasks)
+
+    resumed = await SessionManager.resume_session("3", "python typing", user="alice")
+    assert resumed.messages[0]["content"] == "python packaging"
+    stranger = await SessionManager.resume_session("4", "python typing", user="carol")
+    assert stranger.messages == []
+    await SessionManager.writer.close()
+
+
+@pytest.mark.asyncio
+async def test_shards_merge_saved_vectors(session_manager, embedder, monkeypatch):
+    """shard workers started together save their own embeddings to one file"""
+    monkeypatch.setattr(SessionManager, "embedder", embedder(KEYWORDS))
+    workers = []
+    for session_id, subject in [("1", "best pizza in town"), ("2", "python typing")]:
+        monkeypatch.setattr(SessionManager, "index", VectorIndex())
+        monkeypatch.setattr(SessionManager, "indexed_subjects", {})
+        session = await SessionManager.get_session(session_id, model="gpt-3.5-turbo")
+        session(subject)
+        await SessionManager.save_session(session_id)
+        await asyncio.gather(*SessionManager.tasks)
+        workers.append((SessionManager.index, SessionManager.indexed_subjects))
+
+    for index, indexed_subjects in workers:
+        monkeypatch.setattr(SessionManager, "index", index)
+        monkeypatch.setattr(SessionManager, "indexed_subjects", indexed_subjects)
+        SessionManager.save_vectors()
+    SessionManager.load_vectors()
+    assert sorted(SessionManager.index.ids) == ["1", "2"]
+    await SessionManager.writer.close()
@@ -0,0 +1,198 @@
+import queue
+import asyncio
+import threading
+from collections import Counter
+import pytest
+from glados.backend.shard import HashRing, ShardRouter, routing_key, serve_worker
+from glados.backend.cache import LRUCache
+from glados.session import Session, SessionManager
+
+KEYS = [f"1700000000.{i:06d}" for i in range(10000)]
+
+
+def test_ring_balance():
+    ring = HashRing(range(4))
+    counts = Counter(ring.get(key) for key in KEYS)
+    assert set(counts) == {0, 1, 2, 3}
+    # every node gets its share within 25%
+    assert all(abs(count - 2500) < 625 for count in counts.values())
+
+
+def test_ring_stable():
+    assert [HashRing(range(4)).get(key) for key in KEYS[:100]] == [
+        HashRing([3, 2, 1, 0]).get(key) for key in KEYS[:100]
+    ]
+
+
+def test_ring_add_moves_only_to_new_node():
+    ring = HashRing(range(4))
+    before = {key: ring.get(key) for key in KEYS}
+    ring.add(4)
+    moved = [key for key in KEYS if ring.get(key) != before[key]]
+    assert all(ring.get(key) == 4 for key in moved)
+    assert len(moved) < len(KEYS) / 4
+
+
+def test_ring_remove_moves_only_from_removed_node():
+    ring = HashRing(range(4))
+    before = {key: ring.get(key) for key in KEYS}
+    ring.remove(2)
+    moved = [key for key in KEYS if ring.get(key) != before[key]]
+    assert all(before[key] == 2 for key in moved)
+    assert all(ring.get(key) != 2 for key in KEYS)
+
+
+def test_routing_key():
+    assert routing_key({"event": {"ts": "1.0", "thread_ts": "0.5"}}) == "0.5"
+    assert routing_key({"event": {"ts": "1.0"}}) == "1.0"
+    assert routing_key({"type": "app_home_opened"}) is None
+
+
+class FakeProcess:
+    def is_alive(self):
+        return True
+
+    def join(self, timeout=None):
+        pass
+
+
+class FakeInbox:
+    """inbox of an in-process worker, logging what it gets and replying at once,
+    except releases which take a while like writing to database"""
+
+    def __init__(self, router: "FakeRouter", shard: int):
+        self.router = router
+        self.shard = shard
+
+    def put(self, message):
+        kind, *args = message
+        if kind == "event":
+            self.router.log.append((self.shard, kind, [routing_key(*args)]))
+            return
+        self.router.log.append((self.shard, kind, args[-1]))
+        request_id = args[0]
+
+        def reply():
+            if kind == "release":
+                self.router.log.append((self.shard, "released", args[-1]))
+            self.router._outbox.put((request_id, self.shard))
+
+        if kind == "release":
+            threading.Timer(0.05, reply).start()
+        else:
+            reply()
+
+
+class FakeRouter(ShardRouter):
+    def __init__(self, num_shards: int):
+        super().__init__(num_shards)
+        self._outbox = queue.Queue()
+        self.log: list[tuple] = []
+        self.started: list[int] = []
+
+    def _start_worker(self, shard: int):
+        self.started.append(shard)
+        self.workers[shard] = (FakeProcess(), FakeInbox(self, shard))
+
+
+def event(ts: str) -> dict:
+    return {"event": {"type": "message", "ts": ts}}
+
+
+@pytest.mark.asyncio
+async def test_resize_hands_off_sessions_before_events():
+    router = FakeRouter(2)
+    await router.start()
+    keys = KEYS[:200]
+    for key in keys:
+        await router.route(event(key))
+    before = {key: router.ring.get(key) for key in keys}
+
+    try:
+        await router.resize(3)
+        for key in keys:
+            await router.route(event(key))
+    finally:
+        await router.close()
+    moved = [key for key in keys if router.ring.get(key) != before[key]]
+    assert moved and all(router.ring.get(key) == 2 for key in moved)
+
+    def position(shard, kind, key):
+        return next(
+            i
+            for i, (s, k, value) in enumerate(router.log)
+            if s == shard and k == kind and key in value
+        )
+
+    # every shard left releases the cached sessions it does not own any more
+    assert {shard for shard, kind, _ in router.log if kind == "release"} == {0, 1}
+    for key in moved:
+        released = position(before[key], "released", key)
+        adopted = position(2, "adopt", key)
+        first_event = position(2, "event", key)
+        assert released < adopted < first_event
+
+
+@pytest.mark.asyncio
+async def test_concurrent_scale_serialized():
+    router = FakeRouter(2)
+    await router.start()
+    await asyncio.gather(router.scale(1), router.scale(1))
+    assert sorted(router.workers) == [0, 1, 2, 3]
+    assert sorted(router.started) == [0, 1, 2, 3]
+    await router.scale(-3)
+    assert sorted(router.workers) == [0]
+    await router.close()
+
+
+@pytest.mark.asyncio
+async def test_worker_release_and_adopt(
+    session_manager, slow_writes, fake_tokenizer, monkeypatch
+):
+    col, started = slow_writes
+    monkeypatch.setattr(SessionManager, "sessions", LRUCache(10))
+    inbox, outbox = queue.Queue(), queue.Queue()
+    handled = []
+
+    async def handle(payload):
+        handled.append(payload)
+
+    await SessionManager.load_index()
+    worker = asyncio.create_task(serve_worker(0, inbox, outbox, handle=handle))
+    loop = asyncio.get_running_loop()
+
+    async def request(*message):
+        inbox.put(message)
+        return await loop.run_in_executor(None, outbox.get)
+
+    try:
+        ring = HashRing(range(2))
+        kept, dropped = [next(k for k in KEYS if ring.get(k) == s) for s in (0, 1)]
+        for session_id in ["t1", kept, dropped]:
+            session = await SessionManager.get_session(session_id)
+            session("hello")
+        # a session written in background, not cached any more
+        evicted = Session("t0")
+        evicted("bye")
+        SessionManager.writer.mark("t0", evicted)
+        writing = asyncio.create_task(SessionManager.flush())
+        await started.wait()
+
+        assert await request("release", 1, ring, ["t1"]) == (1, 0)
+        assert list(SessionManager.sessions) == [kept]
+        snapshots = {snapshot["session_id"]: snapshot for snapshot in col.documents}
+        assert {"t0", "t1", dropped} <= set(snapshots)
+        assert snapshots["t1"]["messages"][-1]["content"] == "hello"
+        await writing
+
+        # sessions created by other workers after the index was loaded
+        assert await request("adopt", 2, ["t2"]) == (2, 0)
+        assert await SessionManager.has_session("t2")
+        await col.insert_one({"session_id": "t3"})
+        assert await SessionManager.has_session("t3")
+
+        inbox.put(("event", event("t2")))
+    finally:
+        assert await request("stop", 3) == (3, 0)
+        await worker
+    assert handled == [event("t2")]
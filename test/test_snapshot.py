@@ -0,0 +1,65 @@
+import pytest
+from glados.backend import snapshot as snapshots
+from glados.backend.migrate import migrate_snapshots
+from glados.session import Session, make_session_update
+
+pytest.importorskip("msgpack")
+pytest.importorskip("zstandard")
+pytestmark = pytest.mark.usefixtures("fake_tokenizer")
+
+messages = [
+    {"role": "user", "content": "hello"},
+    {"role": "assistant", "content": [{"type": "text", "text": "hi " * 100}]},
+]
+
+
+def test_pack_messages():
+    packed = snapshots.pack_messages(messages)
+    assert isinstance(packed, bytes)
+    assert snapshots.unpack_messages(packed) == messages
+
+
+def test_read_both_layouts():
+    raw = {"session_id": "1", "messages": messages, "token_counts": [1, 2]}
+    compact = {
+        "session_id": "1",
+        "format_version": snapshots.COMPACT_FORMAT,
+        "packed_messages": snapshots.pack_messages(messages),
+        "token_counts": [1, 2],
+    }
+    assert Session.from_snapshot(raw).messages == messages
+    assert Session.from_snapshot(compact).messages == messages
+
+
+def test_compact_session_update(monkeypatch):
+    monkeypatch.setattr(snapshots, "SNAPSHOT_FORMAT", snapshots.COMPACT_FORMAT)
+    session = Session.from_snapshot(
+        {"session_id": "1", "messages": messages[:1], "token_counts": [1]}
+    )
+    assert session.rewrite  # stored in raw layout
+
+    session.unsaved = 0
+    session.rewrite = False
+    session.append(messages[1])
+    update = make_session_update(session)._doc
+    assert "$push" not in update
+    assert update["$unset"] == {"messages": ""}
+    assert update["$set"]["format_version"] == snapshots.COMPACT_FORMAT
+    assert snapshots.unpack_messages(update["$set"]["packed_messages"]) == messages
+
+
+@pytest.mark.asyncio
+async def test_migrate_snapshots(fake_db):
+    col = fake_db.get_collection("sessions")
+    for i in range(5):
+        await col.insert_one({"session_id": str(i), "messages": messages})
+
+    assert await migrate_snapshots(snapshots.COMPACT_FORMAT, batch_size=2) == 5
+    assert col.calls.count("bulk_write") == 3
+    assert all("messages" not in document for document in col.documents)
+    assert await migrate_snapshots(snapshots.COMPACT_FORMAT) == 0
+
+    assert await migrate_snapshots(snapshots.RAW_FORMAT) == 5
+    restored = await col.find_one({"session_id": "0"})
+    assert restored["messages"] == messages
+    assert "packed_messages" not in restored
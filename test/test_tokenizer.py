@@ -0,0 +1,29 @@
+from glados.backend import tokenizer
+
+
+def test_encoding_fallback(monkeypatch):
+    monkeypatch.setattr(tokenizer.tiktoken, "get_encoding", lambda name: name)
+    tokenizer.get_encoding.cache_clear()
+    try:
+        assert tokenizer.get_encoding("gpt-4o-mini") == "o200k_base"
+        assert tokenizer.get_encoding("gpt-3.5-turbo") == "cl100k_base"
+        assert tokenizer.get_encoding("unknown-model") == tokenizer.DEFAULT_ENCODING
+    finally:
+        tokenizer.get_encoding.cache_clear()
+
+
+def test_encoding_is_cached(monkeypatch):
+    resolved = []
+
+    def get_encoding(name):
+        resolved.append(name)
+        return name
+
+    monkeypatch.setattr(tokenizer.tiktoken, "get_encoding", get_encoding)
+    tokenizer.get_encoding.cache_clear()
+    try:
+        for _ in range(3):
+            tokenizer.get_encoding("gpt-4o")
+        assert resolved == ["o200k_base"]
+    finally:
+        tokenizer.get_encoding.cache_clear()
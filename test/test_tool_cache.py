@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+from glados.session import Session, SessionManager
+from glados.tool import context, invoke_function
+from glados.tool._cache import ResultCache
+
+pytestmark = pytest.mark.usefixtures("fake_tokenizer")
+
+
+@pytest.fixture
+def result_cache(monkeypatch):
+    cache = ResultCache(100)
+    monkeypatch.setattr("glados.tool.result_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def current_session(monkeypatch):
+    def use(session_id, user):
+        session = Session(session_id, model="gpt-3.5-turbo", user=user)
+        monkeypatch.setattr(SessionManager, "current", session)
+        context.set(session)
+        return session
+
+    return use
+
+
+@pytest.mark.asyncio
+async def test_cache_result(result_cache, current_session, plugin):
+    calls = []
+
+    @plugin(cache_ttl=60)
+    async def lookup(word: str):
+        calls.append(word)
+        return {"word": word}
+
+    current_session("s1", "u1")
+    assert await invoke_function("lookup", word="a") == '{"word": "a"}'
+    current_session("s2", "u2")
+    assert await invoke_function("lookup", word="a") == '{"word": "a"}'
+    await invoke_function("lookup", word="b")
+    assert calls == ["a", "b"]
+    assert result_cache.stats()["lookup"] == {"hits": 1, "misses": 2, "hit_rate": 1 / 3}
+
+
+@pytest.mark.asyncio
+async def test_cache_scope(result_cache, current_session, plugin):
+    calls = []
+
+    @plugin(cache_ttl=60, cache_scope="user")
+    def whoami_cached():
+        calls.append(SessionManager.current.user)
+        return SessionManager.current.user
+
+    current_session("s1", "u1")
+    await invoke_function("whoami_cached")
+    current_session("s2", "u1")
+    await invoke_function("whoami_cached")
+    current_session("s3", "u2")
+    assert await invoke_function("whoami_cached") == '"u2"'
+    assert calls == ["u1", "u2"]
+
+    await result_cache.invalidate("whoami_cached", "u1")
+    current_session("s1", "u1")
+    await invoke_function("whoami_cached")
+    assert calls == ["u1", "u2", "u1"]
+
+    with pytest.raises(ValueError):
+        plugin(lambda: None, cache_ttl=1, cache_scope="channel")
+
+
+@pytest.mark.asyncio
+async def test_cache_scope_task_local(result_cache, monkeypatch, plugin):
+    @plugin(cache_ttl=60, cache_scope="session")
+    async def session_name():
+        await asyncio.sleep(0.01)
+        return context.get().id
+
+    async def chat(session_id):
+        context.set(Session(session_id, model="gpt-3.5-turbo", user="u1"))
+        await asyncio.sleep(0)
+        return await invoke_function("session_name")
+
+    # the process global session is of neither
+    monkeypatch.setattr(SessionManager, "current", Session("s0", model="gpt-3.5-turbo"))
+    assert await asyncio.gather(chat("s1"), chat("s2")) == ['"s1"', '"s2"']
+    assert await asyncio.gather(chat("s2"), chat("s1")) == ['"s2"', '"s1"']
+    assert result_cache.stats()["session_name"]["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_not_cached(result_cache, current_session, plugin):
+    calls = []
+
+    @plugin(cache_ttl=60)
+    def flaky():
+        calls.append(1)
+        return {"error": "try again"}
+
+    current_session("s1", "u1")
+    await invoke_function("flaky")
+    await invoke_function("flaky")
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_database_tier(fake_db, current_session, monkeypatch):
+    current_session("s1", "u1")
+    first = ResultCache(100, use_database=True)
+    key = first.key("lookup", "global", {"word": "a"})
+    await first.set(key, '"cached"', ttl=60)
+
+    # another process finds the result in database
+    second = ResultCache(100, use_database=True)
+    assert await second.get(key) == '"cached"'
+    assert key in second.memory
+
+    await second.invalidate("lookup")
+    assert await ResultCache(100, use_database=True).get(key) is None
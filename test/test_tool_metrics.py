@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from openai.types.beta.threads.runs import FunctionToolCall
+from glados.tool import invoke_tool_call, invoke_tool_calls, tool_stats
+from glados.tool._metrics import ToolMetrics
+
+
+def test_percentiles():
+    metrics = ToolMetrics()
+    for i in range(1, 101):
+        metrics.record("t", i / 100, "ok", 10)
+    stats = metrics.to_dict()["t"]
+    assert stats["calls"] == 100
+    assert stats["latency_p50"] == 0.51
+    assert stats["latency_p95"] == 0.96
+    assert stats["latency_p99"] == 1.0
+    assert stats["result_bytes_avg"] == 10
+
+
+def test_reservoir_bounded():
+    metrics = ToolMetrics()
+    for i in range(5000):
+        metrics.record("t", 0.1, "ok", 1)
+    assert len(metrics.tools["t"].samples) == 1024
+    assert metrics.to_dict()["t"]["calls"] == 5000
+
+
+def test_prometheus():
+    metrics = ToolMetrics()
+    metrics.record("t", 0.03, "ok", 5)
+    metrics.record("t", 3, "timeout", 7)
+    text = metrics.to_prometheus()
+    assert 'glados_tool_calls_total{tool="t"} 2' in text
+    assert 'glados_tool_timeouts_total{tool="t"} 1' in text
+    assert 'glados_tool_latency_seconds_bucket{tool="t",le="0.05"} 1' in text
+    assert 'glados_tool_latency_seconds_bucket{tool="t",le="5"} 2' in text
+    assert 'glados_tool_latency_seconds_bucket{tool="t",le="+Inf"} 2' in text
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_records(monkeypatch, plugin, tool_call):
+    monkeypatch.setattr("glados.tool.metrics", ToolMetrics())
+
+    @plugin(timeout=0.05)
+    async def measured(fail: bool = False, hang: bool = False):
+        if fail:
+            raise ValueError("fail")
+        if hang:
+            await asyncio.sleep(1)
+        return "done"
+
+    await invoke_tool_calls(
+        [
+            tool_call(0, "measured"),
+            tool_call(1, "measured", '{"fail": true}'),
+            tool_call(2, "measured", '{"hang": true}'),
+        ]
+    )
+    stats = tool_stats()["measured"]
+    assert (stats["calls"], stats["errors"], stats["timeouts"]) == (3, 1, 1)
+    assert stats["latency_p99"] >= 0.05
+    assert stats["result_bytes_max"] > len('"done"')
+
+
+@pytest.mark.asyncio
+async def test_assistant_tool_call_records(monkeypatch, plugin):
+    """tool calls of the assistants api, as the slack bot gets them"""
+    monkeypatch.setattr("glados.tool.metrics", ToolMetrics())
+
+    @plugin()
+    def shout(text: str):
+        return text.upper()
+
+    message = await invoke_tool_call(
+        FunctionToolCall(
+            id="call_0",
+            type="function",
+            function={"name": "shout", "arguments": '{"text": "hi"}', "output": None},
+        )
+    )
+    assert message["content"] == '"HI"'
+    assert tool_stats()["shout"]["calls"] == 1
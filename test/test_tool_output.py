@@ -0,0 +1,66 @@
+import json
+import pytest
+from glados.session import Session, make_session_update
+from glados.tool import context, invoke_function, invoke_tool_calls
+from glados.tool._output import budget_output
+
+pytestmark = pytest.mark.usefixtures("fake_tokenizer")
+
+
+def test_budget_output():
+    session = Session(model="gpt-3.5-turbo")
+    assert budget_output("t", "short", 10, session) == "short"
+    assert session.spills == {}
+
+    content = budget_output("t", "x" * 25, 10, session)
+    assert content.startswith("x" * 10 + "\n\n[truncated: showing page 1 of 3.")
+    [(handle, spill)] = session.spills.items()
+    assert handle in content
+    assert spill == {"tool": "t", "content": "x" * 25, "page_tokens": 10}
+
+    # without a session, the rest can't be read later
+    assert budget_output("t", "x" * 25, 10).endswith("[truncated: showing 1 of 3 pages]")
+
+
+def test_spills_bounded_and_saved(monkeypatch):
+    monkeypatch.setattr("glados.session.MAX_SPILLS", 2)
+    session = Session(model="gpt-3.5-turbo")
+    handles = [session.spill("t", str(i)) for i in range(3)]
+    assert list(session.spills) == handles[1:]
+
+    update = make_session_update(session)
+    assert update._doc["$set"]["spills"] == session.spills
+    assert "spills" not in make_session_update(session)._doc["$set"]
+    assert Session.from_snapshot(session.to_dict()).spills == session.spills
+
+
+def test_spills_bounded_by_size(monkeypatch):
+    monkeypatch.setattr("glados.session.MAX_SPILL_BYTES", 10)
+    session = Session(model="gpt-3.5-turbo")
+    first = session.spill("t", "abcd")
+    second = session.spill("t", "efgh")
+    assert list(session.spills) == [first, second]
+    third = session.spill("t", "ijkl")
+    assert list(session.spills) == [second, third]
+
+    # an output over the limit is cut, and the others are dropped
+    fourth = session.spill("t", "가" * 4)
+    assert list(session.spills) == [fourth]
+    assert session.spills[fourth]["content"] == "가" * 3
+
+
+@pytest.mark.asyncio
+async def test_page_through_long_output(plugin, tool_call):
+    @plugin(max_tokens=40)
+    def long_output():
+        return "abcdefghij" * 10
+
+    session = Session(model="gpt-3.5-turbo")
+    context.set(session)
+    [message] = await invoke_tool_calls([tool_call(0, "long_output")])
+    assert message["content"].startswith('"abcdefghijabcdefghij')
+    assert "page 1 of 3" in message["content"]
+
+    [handle] = session.spills
+    page = json.loads(await invoke_function("read_tool_output", handle=handle, page=3))
+    assert page == json.dumps("abcdefghij" * 10)[80:] + "\n\n[page 3 of 3, the end]"
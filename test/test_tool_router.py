@@ -0,0 +1,35 @@
+import pytest
+from glados.tool._router import ToolRouter
+
+REGISTRY = {
+    "get_date": {"schema": {"description": "returns current date and time"}},
+    "draw_image": {"schema": {"description": "draw an image"}},
+}
+# words of the tool descriptions counted by the stub embedder embedded by the stub embedder
+KEYWORDS = ["date", "time", "image", "draw"]
+
+
+@pytest.mark.asyncio
+async def test_route(embedder):
+    router = ToolRouter(embedder(KEYWORDS), select=0.9, reject=0.3)
+    assert await router.route("please draw an image", REGISTRY) == ["draw_image"]
+    assert await router.route("hello there", REGISTRY) == []
+    # close to draw_image, but not enough to be sure
+    assert await router.route("draw a date", REGISTRY) is None
+
+
+@pytest.mark.asyncio
+async def test_descriptions_embedded_once(embedder):
+    stub = embedder(KEYWORDS)
+    router = ToolRouter(stub)
+    await router.route("what time is it", REGISTRY)
+    await router.route("draw me", REGISTRY)
+    descriptions = [r for r in stub.requests if len(r) > 1]
+    assert len(descriptions) == 1
+
+    changed = {**REGISTRY, "draw_image": {"schema": {"description": "paint"}}}
+    await router.route("draw me", changed)
+    assert stub.requests[-2] == ["draw_image: paint"]
+
+    await router.route("draw me", {"get_date": REGISTRY["get_date"]})
+    assert router.index.ids == ["get_date"]
@@ -1,7 +1,32 @@
-from glados.tool import __registry__, plugin
+import os
+import sys
+import json
+import subprocess
+import asyncio
+import threading
+import time
+import pytest
+from contextvars import ContextVar
+from glados.backend import executor
+from glados.backend.cache import TTLCache
+from glados.tool._manifest import (
+    MANIFEST_PATH,
+    build_manifest,
+    load_manifest,
+    save_manifest,
+)
+from glados.tool import (
+    __registry__,
+    choose_tools,
+    format_tools,
+    invoke_function,
+    invoke_tool_calls,
+    normalize_message,
+    selection_stats,
+)
 
 
-def test_plugin_decorator():
+def test_plugin_decorator(plugin):
     @plugin
     def foo(): ...
 
@@ -25,3 +50,245 @@ def test_plugin_autoload():
     assert hasattr(get_date, "__meta__")
     assert get_date.__meta__.get("name") == "System Date"
     assert get_date.__meta__.get("icon") == "📅"
+
+
+@pytest.mark.asyncio
+async def test_invoke_tool_calls_parallel(plugin, tool_call):
+    @plugin
+    async def slow_echo(text: str, delay: float):
+        await asyncio.sleep(delay)
+        return text
+
+    started = time.perf_counter()
+    messages = await invoke_tool_calls(
+        [
+            tool_call(0, "slow_echo", '{"text": "a", "delay": 0.2}'),
+            tool_call(1, "slow_echo", '{"text": "b", "delay": 0.1}'),
+            tool_call(2, "slow_echo", '{"text": "c", "delay": 0.2}'),
+        ]
+    )
+    assert time.perf_counter() - started < 0.4
+    assert [m["tool_call_id"] for m in messages] == ["call_0", "call_1", "call_2"]
+    assert [m["content"] for m in messages] == ['"a"', '"b"', '"c"']
+
+
+@pytest.mark.asyncio
+async def test_invoke_tool_calls_isolates_failures(plugin, tool_call):
+    @plugin(timeout=0.05)
+    async def hang():
+        await asyncio.sleep(10)
+
+    @plugin
+    def broken():
+        raise ValueError("broken")
+
+    @plugin
+    def ok():
+        return "ok"
+
+    messages = await invoke_tool_calls(
+        [tool_call(0, "hang"), tool_call(1, "broken"), tool_call(2, "ok")]
+    )
+    assert messages[0]["content"].startswith("Error: hang timed out")
+    assert messages[1]["content"] == "Error: broken"
+    assert messages[2]["content"] == '"ok"'
+
+
+@pytest.mark.asyncio
+async def test_invoke_tool_calls_concurrency(plugin, tool_call):
+    running = 0
+    peak = 0
+
+    @plugin(concurrency=2)
+    async def limited():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await invoke_tool_calls([tool_call(i, "limited") for i in range(6)])
+    assert peak == 2
+
+
+def test_concurrency_limit_in_each_loop(plugin, tool_call):
+    """tools run in event loops of shard workers, tests or streamlit reruns"""
+
+    @plugin(concurrency=1)
+    async def one_at_a_time():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    calls = [tool_call(i, "one_at_a_time") for i in range(3)]
+    for _ in range(2):
+        messages = asyncio.run(invoke_tool_calls(calls))
+        assert [m["content"] for m in messages] == ['"ok"'] * 3
+
+
+def process_id():
+    return os.getpid()
+
+
+@pytest.mark.asyncio
+async def test_invoke_function_off_event_loop(plugin):
+    session = ContextVar("session")
+    session.set("main")
+
+    @plugin
+    def blocking():
+        time.sleep(0.1)
+        return [threading.current_thread().name, session.get()]
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*[invoke_function("blocking") for _ in range(3)])
+    assert time.perf_counter() - started < 0.3
+    thread_name, value = json.loads(results[0])
+    assert thread_name != threading.current_thread().name
+    assert value == "main"
+
+    plugin(process_id, executor="process")
+    try:
+        assert json.loads(await invoke_function("process_id")) != os.getpid()
+    finally:
+        executor.shutdown()
+
+
+def test_normalize_message():
+    assert normalize_message("Summarize https://a.com/x?y=1 please!") == (
+        normalize_message("summarize  <https://b.org/z|b.org> please")
+    )
+    assert normalize_message("What is 3 + 4?") == normalize_message("what is 10 + 20")
+    assert normalize_message("draw a cat") != normalize_message("draw a dog")
+
+
+@pytest.mark.asyncio
+async def test_choose_tools_cached(monkeypatch, plugin):
+    import glados.tool
+
+    calls = []
+
+    async def choose_tool_names(message):
+        calls.append(message)
+        return ["get_date"]
+
+    monkeypatch.setattr(glados.tool, "choose_tool_names", choose_tool_names)
+    monkeypatch.setattr(glados.tool, "selection_cache", TTLCache(10, ttl=60))
+    await choose_tools("what time is it on 2024-01-01?")
+    tools = await choose_tools("What time is it on 2025-12-31")
+    assert tools[0]["function"]["name"] == "get_date"
+    assert len(calls) == 1
+    assert selection_stats()["hit_rate"] == 0.5
+
+    @plugin
+    def new_tool(): ...
+
+    await choose_tools("what time is it on 2024-01-01?")
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_choose_tools_list_message(monkeypatch):
+    """a message with attachments from slack is a list of content blocks"""
+    import glados.tool
+
+    calls = []
+
+    async def choose_tool_names(message):
+        calls.append(message)
+        return ["get_date"]
+
+    monkeypatch.setattr(glados.tool, "choose_tool_names", choose_tool_names)
+    monkeypatch.setattr(glados.tool, "selection_cache", TTLCache(10, ttl=60))
+    image = {"type": "image_url", "image_url": {"url": "https://a.com/1.png"}}
+    message = [image, {"type": "text", "text": "What is this on 2024-01-01?"}]
+    assert normalize_message(message) == "<image_url> what is this on <num>"
+    tools = await choose_tools(message)
+    assert tools[0]["function"]["name"] == "get_date"
+    assert calls == [message]
+
+    await choose_tools([image, {"type": "text", "text": "what is this on 2025-12-31"}])
+    assert len(calls) == 1
+    await choose_tools("what is this on 2025-12-31")
+    assert len(calls) == 2
+
+
+def test_manifest(tmp_path, plugin):
+    @plugin
+    def foo(): ...
+
+    path = str(tmp_path / "manifest.json")
+    save_manifest(build_manifest(__registry__), path)
+    manifest = load_manifest(path)
+    assert manifest["plugins"]["get_date"]["module"] == "glados.tool.date"
+    assert "foo" not in manifest["plugins"]  # not from a tool module
+
+    manifest["modules"]["glados.tool.date"] = "changed"
+    save_manifest(manifest, path)
+    assert load_manifest(path) is None
+
+
+def test_manifest_up_to_date():
+    # rebuild with `python -m glados.tool._manifest` after changing a tool module
+    assert load_manifest() is not None
+
+
+def test_stale_manifest_not_written(monkeypatch):
+    import glados.tool
+
+    def written():
+        stat = os.stat(MANIFEST_PATH)
+        return stat.st_ino, stat.st_mtime_ns
+
+    before = written()
+    monkeypatch.setattr(glados.tool, "load_manifest", lambda: None)
+    glados.tool.load_tools()
+    assert callable(__registry__["get_date"]["function"])
+    assert written() == before
+
+
+def test_plugin_imported_lazily():
+    script = (
+        "import sys\n"
+        "from glados.tool import __registry__\n"
+        "assert 'glados.tool.summarize' not in sys.modules\n"
+        "assert __registry__['summarize_url']['schema']['name'] == 'summarize_url'\n"
+        "assert 'glados.tool.summarize' not in sys.modules\n"
+        "assert callable(__registry__['summarize_url']['function'])\n"
+        "assert 'glados.tool.summarize' in sys.modules\n"
+    )
+    env = {**os.environ, "OPENAI_API_KEY": "x"}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", script], check=True, env=env, cwd=root)
+
+
+def test_format_tools_stable():
+    tools = format_tools(["whoami", "get_date", "unknown", "get_date", "file_search"])
+    assert tools[0] == {"type": "file_search"}
+    assert [t["function"]["name"] for t in tools[1:]] == ["get_date", "whoami"]
+    assert format_tools(["unknown"]) is None
+    assert format_tools(["get_date", "whoami"]) == format_tools(["whoami", "get_date"])
+
+
+def test_prompt_prefix_byte_stable():
+    script = (
+        "import sys\n"
+        "from glados.tool import prompt_prefix\n"
+        "names = ['summarize_url', 'whoami', 'get_date', 'draw_image']\n"
+        "sys.stdout.buffer.write(prompt_prefix('You are GLaDOS.', names))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    outputs = set()
+    for seed, manifest in [("1", "1"), ("2", "1"), ("3", "0")]:
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": "x",
+            "PYTHONHASHSEED": seed,
+            "GLADOS_TOOL_MANIFEST": manifest,
+        }
+        outputs.add(
+            subprocess.run(
+                [sys.executable, "-c", script], env=env, cwd=root, capture_output=True
+            ).stdout
+        )
+    assert len(outputs) == 1
+    assert outputs.pop().startswith(b'{"system":"You are GLaDOS.","tools":[{')
@@ -0,0 +1,44 @@
+import numpy as np
+from glados.backend.vector import VectorIndex
+
+
+def test_search_by_cosine_similarity():
+    index = VectorIndex()
+    index.upsert("x", [1, 0, 0])
+    index.upsert("y", [0, 2, 0])
+    index.upsert("xy", [1, 1, 0])
+
+    assert [id for id, _ in index.search([1, 0.1, 0], k=2)] == ["x", "xy"]
+    [(id, score)] = index.search([0, 5, 0])
+    assert id == "y"
+    assert np.isclose(score, 1.0)
+
+
+def test_upsert_and_remove():
+    index = VectorIndex()
+    for i in range(100):
+        index.upsert(str(i), [i, 1])
+    index.upsert("0", [0, -1])
+    assert len(index) == 100
+    assert index.search([0, -1])[0][0] == "0"
+
+    index.remove("0")
+    index.remove("unknown")
+    assert "0" not in index
+    assert len(index) == 99
+    assert index.search([0, -1])[0][0] != "0"
+    assert index.positions["99"] == 0
+
+
+def test_save_and_load(tmp_path):
+    index = VectorIndex()
+    index.upsert("a", [1, 2, 3])
+    index.upsert("b", [3, 2, 1])
+    path = tmp_path / "index.npz"
+    index.save(path)
+
+    loaded = VectorIndex.load(path)
+    assert loaded.ids == ["a", "b"]
+    assert np.allclose(loaded.vectors, index.vectors)
+    loaded.upsert("c", [1, 1, 1])
+    assert len(loaded) == 3